@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Measure the throughput of the collector (proc.Workflow) with busy hosts:
+# each emitter prints many lines per second, with lost replies, duplicates
+# and lines which arrive in two separate reads.
+#
+# With "--workers", the hosts are handled by worker processes, and the CPU
+# usage is the one of the collector thread which merges their results.
+
+import argparse
+import time
+import json
+import common
+import ping_multi_ext.proc
+import ping_multi_ext.shard
+import ping_multi_ext.host
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collector with busy synthetic hosts.')
+    parser.add_argument('-n', '--hosts', type=int, default=50)
+    parser.add_argument('-i', '--interval', type=float, default=0.01)
+    parser.add_argument('-d', '--duration', type=float, default=10)
+    parser.add_argument('--loss', type=float, default=0.05)
+    parser.add_argument('--dup', type=float, default=0.01)
+    parser.add_argument('--partial', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=None,
+        help='use this many worker processes; default=none')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    common.raise_nofile_limit(args.hosts + 100)
+
+    hosts_data = common.make_hosts_data([
+        (f'host{i}', common.emitter_cmd(f'host{i}', args.interval, args.loss, args.dup, args.partial))
+        for i in range(args.hosts)
+    ])
+    if args.workers is None:
+        workflow = ping_multi_ext.proc.Workflow(hosts_data, 1)
+    else:
+        workflow = ping_multi_ext.shard.ShardedWorkflow(hosts_data, 1, workers=args.workers)
+
+    try:
+        workflow.start_all_processes()
+
+        # let the interpreters of the emitters start up
+        t_start = time.monotonic()
+        while time.monotonic() - t_start < 2:
+            workflow.update_hosts_data(0.05)
+        lines_start = sum(host_data.raw.total() for host_data in hosts_data.values())
+
+        cpu_start = time.thread_time()
+        t_start = time.monotonic()
+        while time.monotonic() - t_start < args.duration:
+            workflow.update_hosts_data(0.05)
+        cpu_secs = time.thread_time() - cpu_start
+        wall_secs = time.monotonic() - t_start
+    finally:
+        if args.workers is None:
+            common.kill_all(hosts_data)
+        else:
+            workflow.stop_workers()
+
+    lines = sum(host_data.raw.total() for host_data in hosts_data.values()) - lines_start
+    # split lines must be put together again, so there should be no parse errors
+    parse_errors = sum(
+        1 for host_data in hosts_data.values() for pd in host_data.parsed if pd == ping_multi_ext.host.PD_ERROR
+    )
+
+    res = {
+        'hosts': args.hosts,
+        'workers': args.workers,
+        'lines_per_sec': round(lines / wall_secs, 1),
+        'collector_cpu_pct': round(cpu_secs / wall_secs * 100, 1),
+        'collector_cpu_pct_per_host': round(cpu_secs / wall_secs * 100 / args.hosts, 3),
+        'cpu_usec_per_line': round(cpu_secs / max(1, lines) * 1e6, 1),
+        'parse_errors': parse_errors,
+    }
+
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f'{k:>26}: {v}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Measure the lines per CPU second of the collector, from reading the pipes
+# to the parsed statistics, without the cost of producing the output: each
+# host runs "cat" on a prepared file, so the reads are as large as the pipe
+# allows.
+#
+# The "ping" scenario is the synthetic output of emitter.py. The "long"
+# scenario has lines of "--long-kb" KiB, which arrive in many reads each.
+
+import argparse
+import os
+import time
+import json
+import shlex
+import tempfile
+import common
+import emitter
+import ping_multi_ext.proc
+
+def write_ping_output(path, host, lines_cnt):
+    lines = emitter.synthetic_ping_lines(host, None, 0.05, 0.01)
+    with open(path, 'w') as f:
+        for _ in range(lines_cnt):
+            f.write(next(lines) + '\n')
+
+def write_long_output(path, lines_cnt, line_kb):
+    line = 'x' * (line_kb * 1024 - 1) + '\n'
+    with open(path, 'w') as f:
+        for _ in range(lines_cnt):
+            f.write(line)
+
+def measure(paths):
+    hosts_data = common.make_hosts_data([
+        (f'host{i}', 'cat {}'.format(shlex.quote(path))) for i, path in enumerate(paths)
+    ])
+    workflow = ping_multi_ext.proc.Workflow(hosts_data, 1)
+
+    cpu_start = time.thread_time()
+    t_start = time.monotonic()
+    workflow.start_all_processes()
+    while any(host_data.pid is not None for host_data in hosts_data.values()):
+        workflow.update_hosts_data(0.05)
+    cpu_secs = time.thread_time() - cpu_start
+    wall_secs = time.monotonic() - t_start
+
+    # each host also has its first empty line and the two lines after the exit
+    lines = sum(host_data.raw.total() - 3 for host_data in hosts_data.values())
+    return {
+        'lines': lines,
+        'lines_per_cpu_sec': round(lines / cpu_secs),
+        'mb_per_cpu_sec': round(sum(os.path.getsize(path) for path in paths) / cpu_secs / 1e6, 1),
+        'wall_secs': round(wall_secs, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the line assembly and parsing of the collector.')
+    parser.add_argument('-n', '--hosts', type=int, default=20)
+    parser.add_argument('-l', '--lines', type=int, default=50000, help='"ping" lines per host')
+    parser.add_argument('--long-lines', type=int, default=4, help='long lines per host')
+    parser.add_argument('--long-kb', type=int, default=4096, help='the size of a long line in KiB')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    common.raise_nofile_limit(args.hosts + 100)
+
+    res = {'hosts': args.hosts}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, f'ping{i}') for i in range(args.hosts)]
+        for i, path in enumerate(paths):
+            write_ping_output(path, f'host{i}', args.lines)
+        res['ping'] = measure(paths)
+
+        paths = [os.path.join(tmp_dir, f'long{i}') for i in range(args.hosts)]
+        for path in paths:
+            write_long_output(path, args.long_lines, args.long_kb)
+        res['long'] = measure(paths)
+        res['long']['line_kb'] = args.long_kb
+
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f'{k:>6}: {v}')
+
+if __name__ == '__main__':
+    main()
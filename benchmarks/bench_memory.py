@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Measure how much memory "hosts_data" takes at the start, and how it grows
+# over simulated hours of pinging. The synthetic output is fed straight into
+# the collector, one line per read, as fast as possible, so an hour of one
+# probe per second takes seconds.
+
+import argparse
+import json
+import gc
+import common
+import emitter
+import ping_multi_ext.lib
+import ping_multi_ext.proc
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the memory growth of the host data.')
+    parser.add_argument('-n', '--hosts', type=int, default=50)
+    parser.add_argument('--hours', type=int, default=4)
+    parser.add_argument('-i', '--interval', type=float, default=1,
+        help='the simulated seconds between two probes')
+    parser.add_argument('--loss', type=float, default=0.05)
+    parser.add_argument('--dup', type=float, default=0.01)
+    parser.add_argument('--history-limit', type=ping_multi_ext.lib.history_limit_type, default=None)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    hostnames = [f'host{i}' for i in range(args.hosts)]
+    gc.collect()
+    rss_before = common.rss_bytes()
+    hosts_data = common.make_hosts_data(
+        [(hostname, 'true') for hostname in hostnames], history_limit=args.history_limit
+    )
+    gc.collect()
+    start_bytes_per_host = (common.rss_bytes() - rss_before) / args.hosts
+
+    workflow = ping_multi_ext.proc.Workflow(hosts_data, 1)
+
+    generators = {
+        hostname: emitter.synthetic_ping_lines(hostname, None, args.loss, args.dup)
+        for hostname in hostnames
+    }
+    # roughly, as the duplicates are extra lines
+    lines_per_hour = round(3600 / args.interval)
+
+    gc.collect()
+    rss_start = common.rss_bytes()
+    rss_per_hour = []
+
+    for _ in range(args.hours):
+        for hostname in hostnames:
+            lines = generators[hostname]
+            for _ in range(lines_per_hour):
+                workflow.handle_output(hostname, next(lines) + '\n', False)
+
+        gc.collect()
+        rss_per_hour.append(common.rss_bytes() - rss_start)
+
+    last_hour_growth = rss_per_hour[-1] - (rss_per_hour[-2] if len(rss_per_hour) > 1 else 0)
+
+    res = {
+        'hosts': args.hosts,
+        'simulated_hours': args.hours,
+        'lines_per_host_per_hour': lines_per_hour,
+        'history_limit': args.history_limit,
+        'start_bytes_per_host': round(start_bytes_per_host),
+        'rss_growth_mb_after_each_hour': [round(rss / 2**20, 1) for rss in rss_per_hour],
+        'last_hour_bytes_per_host': round(last_hour_growth / args.hosts),
+    }
+
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f'{k:>26}: {v}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Measures how long a scrape of the "--metrics-listen" endpoint takes with
+# many hosts, when all hosts changed (the first scrape), when only a few
+# hosts changed since the last scrape, and when nothing changed.
+
+import argparse
+import random
+import time
+import json
+import common
+import ping_multi_ext.metrics
+import ping_multi_ext.parser
+
+def feed(exporter, hosts_data, hostnames):
+    for hostname in hostnames:
+        data = hosts_data[hostname]
+        rtt = random.randint(1, 300)
+        with data.lock:
+            data.tx_cnt += 1
+            data.rx_cnt += 1
+            data.last = rtt
+            exporter.add_sample(hostname, ping_multi_ext.parser.LINE_REPLY, 1, rtt, False, 0)
+
+def timed_render(exporter):
+    t_start = time.perf_counter()
+    body = exporter.render()
+    return (time.perf_counter() - t_start) * 1000, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the rendering of the Prometheus metrics.')
+    parser.add_argument('-n', '--hosts', type=int, default=10000)
+    parser.add_argument('-c', '--changed', type=int, default=100,
+        help='number of hosts with new samples between two scrapes')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    hostnames = [f'host-{idx}' for idx in range(args.hosts)]
+    hosts_data = common.make_hosts_data([(hostname, 'true') for hostname in hostnames])
+    exporter = ping_multi_ext.metrics.MetricsExporter(hosts_data, hostnames)
+
+    feed(exporter, hosts_data, hostnames)
+    (full_ms, body_len) = timed_render(exporter)
+
+    feed(exporter, hosts_data, random.sample(hostnames, args.changed))
+    (partial_ms, _) = timed_render(exporter)
+
+    (unchanged_ms, _) = timed_render(exporter)
+
+    res = {
+        'hosts': args.hosts,
+        'body_bytes': body_len,
+        'full_render_ms': round(full_ms, 2),
+        'changed_hosts': args.changed,
+        'partial_render_ms': round(partial_ms, 2),
+        'unchanged_render_ms': round(unchanged_ms, 3),
+    }
+
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f'{k:>20}: {v}')
+
+if __name__ == '__main__':
+    main()
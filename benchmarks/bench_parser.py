@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark of the "ping" line parser over the recorded output in "corpus/".
+# The previous implementation, which ran up to five uncompiled regular
+# expressions per line, is kept here as a baseline.
+
+import argparse
+import os
+import re
+import time
+import json
+import common
+import ping_multi_ext.parser
+
+def legacy_parse(line):
+    seq = None
+    m = re.search(r'\sicmp_seq=(\d+)(\s|$)', line)
+    if m:
+        seq = int(m.group(1))
+
+    if re.search(r'^no answer yet for icmp_seq=\d+$', line):
+        return (seq, '*')
+
+    line = line.strip()
+    if not len(line):
+        return (seq, None)
+    if re.search(r'^PING\s.+((bytes of data)|(data bytes))', line):
+        return (seq, None)
+    m = re.search(r'^\d+\sbytes\sfrom\s.+\sttl=\d+\s+time=([\d\.]+)\sms$', line)
+    if not m:
+        return (seq, '???')
+    return (seq, round(float(m.group(1))))
+
+def load_corpus():
+    corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+    lines = []
+    for fname in sorted(os.listdir(corpus_dir)):
+        with open(os.path.join(corpus_dir, fname)) as f:
+            lines.extend(f.read().split('\n'))
+    return lines
+
+def measure(func, lines, rounds):
+    t_start = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            func(line)
+    return len(lines) * rounds / (time.perf_counter() - t_start)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ping output line parser.')
+    parser.add_argument('-r', '--rounds', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    lines = load_corpus()
+    line_parser = ping_multi_ext.parser.PingLineParser()
+    byte_lines = [line.encode('ascii') for line in lines] # as read from the pipes
+
+    res = {
+        'corpus_lines': len(lines),
+        'legacy_lines_per_sec': round(measure(legacy_parse, lines, args.rounds)),
+        'parser_lines_per_sec': round(measure(line_parser.parse, byte_lines, args.rounds)),
+    }
+    res['speedup'] = round(res['parser_lines_per_sec'] / res['legacy_lines_per_sec'], 2)
+
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f'{k:>22}: {v}')
+
+if __name__ == '__main__':
+    main()
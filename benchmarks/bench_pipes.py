@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Measure the cost of the pipe multiplexer in proc.Workflow with thousands
+# of fake ping emitters, most of which are idle at any given moment.
+
+import argparse
+import time
+import json
+import common
+import ping_multi_ext.proc
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipe multiplexer of the collector.')
+    parser.add_argument('-n', '--hosts', type=int, default=2000)
+    parser.add_argument('-i', '--interval', type=float, default=5)
+    parser.add_argument('-d', '--duration', type=float, default=10)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    common.raise_nofile_limit(args.hosts + 100)
+
+    hosts_data = common.make_hosts_data([
+        (f'host{i}', common.fake_ping_cmd(f'host{i}', args.interval)) for i in range(args.hosts)
+    ])
+    workflow = ping_multi_ext.proc.Workflow(hosts_data, 1)
+
+    t_start = time.monotonic()
+    workflow.start_all_processes()
+    startup_secs = time.monotonic() - t_start
+
+    try:
+        wakeups = 0
+        cpu_start = time.thread_time()
+        t_start = time.monotonic()
+        while time.monotonic() - t_start < args.duration:
+            workflow.update_hosts_data(0.05)
+            wakeups += 1
+        cpu_secs = time.thread_time() - cpu_start
+        wall_secs = time.monotonic() - t_start
+    finally:
+        common.kill_all(hosts_data)
+
+    lines = sum(len(host_data.raw) - 1 for host_data in hosts_data.values())
+
+    res = {
+        'hosts': args.hosts,
+        'startup_secs': round(startup_secs, 3),
+        'lines_per_sec': round(lines / wall_secs, 1),
+        'collector_cpu_pct': round(cpu_secs / wall_secs * 100, 1),
+        'cpu_usec_per_wakeup': round(cpu_secs / wakeups * 1e6, 1),
+        'cpu_usec_per_line': round(cpu_secs / max(1, lines) * 1e6, 1),
+    }
+
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f'{k:>20}: {v}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Measure the time to compose and print one frame of the main screen
+# against a fake terminal of a fixed size, whose output is only counted.
+#
+# "idle" frames have no new data. Before each "busy" frame, every host gets
+# a new probe result, which is the worst case for the renderer. "raw" frames
+# show the tail of the raw output of one host with a long history.
+
+import io
+import argparse
+import time
+import json
+import contextlib
+from collections import deque
+from blessings import Terminal
+import common
+import emitter
+import ping_multi_ext.core
+import ping_multi_ext.proc
+
+gvars = ping_multi_ext.core.gvars
+
+class FakeTerminal(Terminal):
+    def __init__(self, height, width):
+        super().__init__(kind='xterm-256color', stream=io.StringIO(), force_styling=True)
+        self.fake_size = (height, width)
+
+    @property
+    def height(self):
+        return self.fake_size[0]
+
+    @property
+    def width(self):
+        return self.fake_size[1]
+
+class CountingSink:
+    def __init__(self):
+        self.written = 0
+
+    def write(self, s):
+        self.written += len(s)
+
+    def flush(self):
+        pass
+
+def render_frame(term, hosts_data):
+    screen_rows = []
+    ping_multi_ext.core._ui_render_header(screen_rows, [''], 'parsed', None)
+    max_idx = term.height - len(screen_rows) - 1
+    ping_multi_ext.core._ui_render_all_hosts_data(
+        screen_rows, hosts_data, 'parsed', 0, max_idx, None, None, term.width
+    )
+    ping_multi_ext.core.ui_print(term, screen_rows)
+
+def render_raw_frame(term, hosts_data, hostname):
+    screen_rows = []
+    ping_multi_ext.core._ui_render_header(screen_rows, [''], 'raw', hostname)
+    avail_rows = term.height - len(screen_rows)
+    raw_cnt = len(hosts_data[hostname].raw)
+    ping_multi_ext.core._ui_render_all_hosts_data(
+        screen_rows, hosts_data, 'raw', max(0, raw_cnt - avail_rows), raw_cnt - 1, None, hostname, term.width
+    )
+    ping_multi_ext.core.ui_print(term, screen_rows)
+
+def measure(args, hosts_cnt):
+    hostnames = [f'host{i}' for i in range(hosts_cnt)]
+    hosts_data = common.make_hosts_data([(hostname, 'true') for hostname in hostnames])
+    workflow = ping_multi_ext.proc.Workflow(hosts_data, 1)
+
+    generators = {hostname: emitter.synthetic_ping_lines(hostname, None, 0.05) for hostname in hostnames}
+    def feed(lines_cnt):
+        for hostname in hostnames:
+            for _ in range(lines_cnt):
+                workflow.handle_output(hostname, next(generators[hostname]) + '\n', False)
+
+    feed(args.history)
+
+    term = FakeTerminal(args.height, args.width)
+    gvars['term'] = term
+    gvars['time_scale'] = deque(['success', 'raw', 'numbered'])
+    gvars['ui_rows_cache'] = {}
+    gvars['ui_strips'] = {}
+    for key in ['ui_old_size', 'ui_old_screen', 'ui_old_rows']:
+        gvars.pop(key, None)
+
+    sink = CountingSink()
+    with contextlib.redirect_stdout(sink):
+        render_frame(term, hosts_data) # the first frame clears the screen
+
+        t_start = time.perf_counter()
+        for _ in range(args.frames):
+            render_frame(term, hosts_data)
+        idle_secs = time.perf_counter() - t_start
+
+        busy_secs = 0
+        written_start = sink.written
+        for _ in range(args.frames):
+            feed(1)
+            t_start = time.perf_counter()
+            render_frame(term, hosts_data)
+            busy_secs += time.perf_counter() - t_start
+        busy_bytes = sink.written - written_start
+
+        for _ in range(args.raw_history):
+            workflow.handle_output(hostnames[0], next(generators[hostnames[0]]) + '\n', False)
+        raw_secs = 0
+        for _ in range(args.frames):
+            feed(1)
+            t_start = time.perf_counter()
+            render_raw_frame(term, hosts_data, hostnames[0])
+            raw_secs += time.perf_counter() - t_start
+
+    return {
+        'hosts': hosts_cnt,
+        'terminal': f'{args.width}x{args.height}',
+        'idle_frame_ms': round(idle_secs / args.frames * 1000, 3),
+        'busy_frame_ms': round(busy_secs / args.frames * 1000, 3),
+        'busy_frame_bytes': round(busy_bytes / args.frames),
+        'raw_lines': len(hosts_data[hostnames[0]].raw),
+        'raw_frame_ms': round(raw_secs / args.frames * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the rendering of the main screen.')
+    parser.add_argument('-n', '--hosts', type=int, action='append', default=None,
+        help='number of hosts; you can specify this option many times; default=50, 600 and 5000')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--history', type=int, default=100,
+        help='number of lines of each host before the measurement')
+    parser.add_argument('--raw-history', type=int, default=100000,
+        help='number of extra lines of the host in the "raw" frames')
+    parser.add_argument('--width', type=int, default=200)
+    parser.add_argument('--height', type=int, default=60)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    for hosts_cnt in args.hosts or [50, 600, 5000]:
+        res = measure(args, hosts_cnt)
+
+        if args.json:
+            print(json.dumps(res))
+        else:
+            print(', '.join(f'{k}={v}' for k, v in res.items()))
+
+if __name__ == '__main__':
+    main()
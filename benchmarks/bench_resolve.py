@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Measures how long the "--resolve" stage takes for a host file with many
+# names, against a stand-in resolver with a fixed latency per lookup, so
+# that no DNS server is needed. Compares one lookup at a time (what the
+# "ping" commands do without "--resolve") with the thread pool.
+
+import argparse
+import time
+import json
+import common
+import ping_multi_ext.resolve
+
+# Answers like a DNS server which is "latency_ms" away. Every
+# "failing"-th name doesn't exist.
+def stand_in_lookup(latency_ms, failing):
+    def lookup(name):
+        time.sleep(latency_ms / 1000)
+        idx = int(name.split('-')[1])
+        if failing and idx % failing == 0:
+            raise OSError(f'{name}: Name or service not known')
+        return '10.{}.{}.{}'.format(idx >> 16 & 0xff, idx >> 8 & 0xff, idx & 0xff)
+    return lookup
+
+def timed_resolve(names, lookup, max_workers):
+    t_start = time.perf_counter()
+    results = ping_multi_ext.resolve.resolve_all(names, lookup, max_workers)
+    return (time.perf_counter() - t_start) * 1000, results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the resolution of the hostnames with "--resolve".')
+    parser.add_argument('-n', '--hosts', type=int, default=600)
+    parser.add_argument('--latency', type=float, default=20, help='latency of each lookup in milliseconds')
+    parser.add_argument('--duplicates', type=int, default=100, help='number of names which are given twice')
+    parser.add_argument('--failing', type=int, default=50, help='every N-th name cannot be resolved; 0 for none')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    names = [f'host-{idx}' for idx in range(args.hosts)]
+    names += names[:args.duplicates]
+    lookup = stand_in_lookup(args.latency, args.failing)
+
+    (serial_ms, _) = timed_resolve(names, lookup, 1)
+    (parallel_ms, results) = timed_resolve(names, lookup, ping_multi_ext.resolve.MAX_WORKERS)
+
+    res = {
+        'names': len(names),
+        'unique_names': len(results),
+        'unresolved': sum(1 for (address, _) in results.values() if address is None),
+        'latency_ms': args.latency,
+        'serial_ms': round(serial_ms, 1),
+        'parallel_ms': round(parallel_ms, 1),
+        'workers': ping_multi_ext.resolve.MAX_WORKERS,
+    }
+
+    if args.json:
+        print(json.dumps(res))
+    else:
+        for k, v in res.items():
+            print(f'{k:>20}: {v}')
+
+if __name__ == '__main__':
+    main()
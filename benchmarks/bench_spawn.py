@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+# Measure the time-to-first-result across N hosts, i.e. how long it takes
+# from the start of the collector until each host reports its first probe.
+# Both process launchers are compared: posix_spawn() through the PDEATHSIG
+# helper, and the fallback fork() of the interpreter.
+
+import argparse
+import time
+import json
+import common
+import ping_multi_ext.proc
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def measure(args, launcher):
+    hosts_data = common.make_hosts_data([
+        (f'host{i}', common.fake_ping_cmd(f'host{i}', 60)) for i in range(args.hosts)
+    ])
+    workflow = ping_multi_ext.proc.Workflow(hosts_data, 1, spawn_rate=args.spawn_rate)
+    if launcher == 'fork':
+        workflow.pdeathsig_helper = []
+    elif not len(workflow.pdeathsig_helper):
+        return None # "setpriv" is not available
+
+    first_result = {}
+    def on_sample(hostname, kind, seq, rtt, is_timeout, ts):
+        if hostname not in first_result:
+            first_result[hostname] = time.monotonic()
+    workflow.add_sample_listener(on_sample)
+
+    t_start = time.monotonic()
+    try:
+        workflow.start_all_processes()
+        while len(first_result) < args.hosts and time.monotonic() - t_start < args.max_wait:
+            workflow.update_hosts_data(0.05)
+    finally:
+        common.kill_all(hosts_data)
+
+    ttfr = [t - t_start for t in first_result.values()]
+    if not len(ttfr):
+        ttfr = [float('nan')]
+
+    return {
+        'launcher': launcher,
+        'hosts': args.hosts,
+        'spawn_rate': args.spawn_rate,
+        'hosts_with_result': len(first_result),
+        'ttfr_p50_secs': round(percentile(ttfr, 50), 3),
+        'ttfr_p95_secs': round(percentile(ttfr, 95), 3),
+        'ttfr_max_secs': round(max(ttfr), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup of the ping processes.')
+    parser.add_argument('-n', '--hosts', type=int, default=300)
+    parser.add_argument('--spawn-rate', type=float, default=None)
+    parser.add_argument('--max-wait', type=float, default=60)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    common.raise_nofile_limit(args.hosts + 100)
+
+    for launcher in ['posix_spawn', 'fork']:
+        res = measure(args, launcher)
+        if res is None:
+            continue
+
+        if args.json:
+            print(json.dumps(res))
+        else:
+            print(', '.join(f'{k}={v}' for k, v in res.items()))
+
+if __name__ == '__main__':
+    main()
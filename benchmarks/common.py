@@ -0,0 +1,64 @@
+import os
+import sys
+import shlex
+import resource
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import ping_multi_ext.core
+
+# Output lines which look like the ones of "ping -O" from iputils.
+# A tiny shell loop is used, so that thousands of emitters can run at once.
+def fake_ping_cmd(host, interval):
+    script = (
+        'echo "PING {0} ({0}) 56(84) bytes of data."; i=0; '
+        'while :; do i=$((i+1)); '
+        'echo "64 bytes from {0}: icmp_seq=$i ttl=64 time=0.$i ms"; '
+        'sleep {1}; done'
+    ).format(host, interval)
+
+    return 'sh -c {}'.format(shlex.quote(script))
+
+# The synthetic "ping" of emitter.py; see there for the meaning of the options.
+def emitter_cmd(host, interval, loss=0.0, dup=0.0, partial=0.0):
+    return '{} {} {} -i {} --loss {} --dup {} --partial {}'.format(
+        shlex.quote(sys.executable), shlex.quote(os.path.join(BENCH_DIR, 'emitter.py')),
+        shlex.quote(host), interval, loss, dup, partial
+    )
+
+def make_hosts_data(ping_list, timeout=1, history_limit=None):
+    if history_limit is None:
+        history_limit = {'lines': None, 'secs': None}
+
+    gvars = ping_multi_ext.core.gvars
+    gvars['cmd_args'] = {
+        'ping': ping_list,
+        'timeout': timeout,
+        'hosts_max_width': 0,
+        'stats_show_initially': 'Last',
+        'history_limit': history_limit,
+    }
+    gvars['hosts_print_order'] = []
+    ping_multi_ext.core._global_pre_init()
+
+    return ping_multi_ext.core.populate_hosts()
+
+# the resident memory of this process
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+def raise_nofile_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+def kill_all(hosts_data):
+    for host_data in hosts_data.values():
+        if host_data.pid:
+            try:
+                os.kill(host_data.pid, 9)
+            except ProcessLookupError:
+                pass
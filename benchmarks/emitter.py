@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# A synthetic "ping -O" which needs no network. It prints the output of
+# iputils "ping" at a configurable rate, with lost replies, duplicates, and
+# lines which are split across two writes, so that the reader gets them in
+# separate reads.
+#
+# synthetic_ping_lines() is also used directly by the benchmarks which feed
+# the collector without any process.
+
+import os
+import sys
+import time
+import random
+import argparse
+
+def synthetic_ping_lines(host, count=None, loss=0.0, dup=0.0, seed=None):
+    rnd = random.Random(host if seed is None else seed)
+
+    yield f'PING {host} ({host}) 56(84) bytes of data.'
+
+    seq = 0
+    while count is None or seq < count:
+        seq += 1
+
+        if rnd.random() < loss:
+            yield f'no answer yet for icmp_seq={seq}'
+            continue
+
+        rtt = rnd.lognormvariate(3, 0.5)
+        yield f'64 bytes from {host}: icmp_seq={seq} ttl=57 time={rtt:.3f} ms'
+        if rnd.random() < dup:
+            yield f'64 bytes from {host}: icmp_seq={seq} ttl=57 time={rtt * 1.1:.3f} ms (DUP!)'
+
+def main():
+    parser = argparse.ArgumentParser(description='Print synthetic "ping -O" output.')
+    parser.add_argument('host')
+    parser.add_argument('-i', '--interval', type=float, default=1,
+        help='seconds between two probes')
+    parser.add_argument('-c', '--count', type=int, default=None,
+        help='exit after this many probes; default=unlimited')
+    parser.add_argument('--loss', type=float, default=0.0,
+        help='probability of a lost reply')
+    parser.add_argument('--dup', type=float, default=0.0,
+        help='probability of a duplicate reply')
+    parser.add_argument('--partial', type=float, default=0.0,
+        help='probability that a line is written in two parts')
+    parser.add_argument('--partial-delay', type=float, default=0.002,
+        help='seconds between the two parts of a split line')
+    parser.add_argument('--seed', default=None)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    fd = sys.stdout.fileno()
+    next_at = time.monotonic()
+
+    try:
+        for line in synthetic_ping_lines(args.host, args.count, args.loss, args.dup, args.seed):
+            data = (line + '\n').encode('ascii')
+
+            if rnd.random() < args.partial:
+                split_at = rnd.randint(1, len(data) - 1)
+                os.write(fd, data[:split_at])
+                time.sleep(args.partial_delay)
+                os.write(fd, data[split_at:])
+            else:
+                os.write(fd, data)
+
+            if line.startswith('PING') or line.endswith('(DUP!)'):
+                continue # not a new probe
+
+            next_at += args.interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except BrokenPipeError:
+        pass
+
+if __name__ == '__main__':
+    main()
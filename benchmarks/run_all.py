@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Run all benchmarks and print their results as a single JSON document,
+# which can be stored and compared between commits.
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (name, arguments) of each benchmark; "--quick" uses the second argument list
+BENCHMARKS = [
+    ('parser', [], ['-r', '200']),
+    ('collector', [], ['-n', '20', '-d', '3']),
+    ('collector', ['--workers', '4'], ['-n', '20', '-d', '3', '--workers', '2']),
+    ('pipes', [], ['-n', '500', '-d', '5']),
+    ('lines', [], ['-n', '5', '-l', '10000', '--long-lines', '1']),
+    ('spawn', [], ['-n', '100']),
+    ('memory', [], ['-n', '10', '--hours', '2']),
+    ('memory', ['--history-limit', '1000'], ['-n', '10', '--hours', '2', '--history-limit', '1000']),
+    ('memory', ['-n', '10000', '--hours', '1', '-i', '60'], ['-n', '2000', '--hours', '1', '-i', '60']),
+    ('render', [], ['-n', '50', '-n', '600', '--frames', '20']),
+    ('metrics', [], ['-n', '2000']),
+    ('resolve', [], ['-n', '100', '--duplicates', '20']),
+]
+
+def git_commit():
+    try:
+        res = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR,
+            capture_output=True, text=True)
+    except OSError:
+        return None
+    return res.stdout.strip() if res.returncode == 0 else None
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all benchmarks.')
+    parser.add_argument('--quick', action='store_true', help='use fewer hosts and shorter runs')
+    parser.add_argument('-o', '--output', metavar='FILE', default='-',
+        help='write the results to FILE; "-" means the standard output; default=-')
+    args = parser.parse_args()
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'quick': args.quick,
+        },
+        'results': [],
+    }
+
+    for (name, full_args, quick_args) in BENCHMARKS:
+        bench_args = quick_args if args.quick else full_args
+        print(f'Running "{name}" {" ".join(bench_args)}', file=sys.stderr, flush=True)
+
+        res = subprocess.run(
+            [sys.executable, os.path.join(BENCH_DIR, f'bench_{name}.py'), '--json'] + bench_args,
+            stdout=subprocess.PIPE, text=True
+        )
+        entry = {
+            'benchmark': name,
+            'args': bench_args,
+            'exit_status': res.returncode,
+            'results': [json.loads(line) for line in res.stdout.splitlines() if line.strip()],
+        }
+        results['results'].append(entry)
+
+    out = json.dumps(results, indent=2) + '\n'
+    if args.output == '-':
+        sys.stdout.write(out)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(out)
+
+if __name__ == '__main__':
+    main()
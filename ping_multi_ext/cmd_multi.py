@@ -1,15 +1,34 @@
 import itertools
+import shutil
 import ping_multi_ext.lib
 import ping_multi_ext.core
-
-def expand_hosts_cidr(hosts, args, parser):
-    hosts_new = []
-
+import ping_multi_ext.recording
+import ping_multi_ext.resolve
+
+# Expands the networks and ranges of addresses one host at a time, and
+# drops the duplicates and the excluded hosts on the way.
+def expand_hosts(hosts, args, parser):
+    try:
+        excluded = ping_multi_ext.lib.HostSet(args['exclude'], True)
+    except ping_multi_ext.lib.CidrDebugError as ex:
+        parser.error('argument -x/--exclude: {}'.format(str(ex)))
+
+    seen = set()
     for host in hosts:
         try:
-            hosts_new += ping_multi_ext.lib.expand_ipv4_network_to_hosts(
-                host, True, args['count_limit']
-            )
+            for expanded in ping_multi_ext.lib.iter_network_hosts(
+                host, True, args['count_limit'], excluded
+            ):
+                if not expanded.startswith('#'): # the comments may repeat
+                    if expanded in seen:
+                        continue
+                    seen.add(expanded)
+
+                    if len(seen) > args['count_limit']:
+                        parser.error('Too many hosts specified (more than {}). '.format(args['count_limit']) +\
+                            'You can increase the limit with -L/--count-limit.')
+
+                yield expanded
         except ping_multi_ext.lib.CidrDebugError as ex:
             parser.error('argument "{}": {}'.format(host, str(ex)))
         except ping_multi_ext.lib.NetworkTooBigError as ex:
@@ -17,13 +36,6 @@ def expand_hosts_cidr(hosts, args, parser):
                 host, ex.num_addresses
             ))
 
-        if len(hosts_new) > args['count_limit']:
-            parser.error('Too many hosts specified ({}). You can increase the limit with -L/--count-limit.'.format(
-                len(hosts_new)
-            ))
-
-    return hosts_new
-
 def _parse_host_token(host, comments_as_sep):
     host = host.strip()
 
@@ -49,6 +61,21 @@ def _iter_host_candidates(args):
             hosts = itertools.chain(hosts, f)
             yield from hosts
 
+# The hosts and the timeout are taken from the recording; nothing is executed.
+def _parse_replay_argv(args, parser):
+    if len(args['host']) or args['file'] is not None:
+        parser.error('Hosts cannot be specified together with --replay')
+
+    try:
+        header = ping_multi_ext.recording.load_header(args['replay'])
+    except (OSError, ping_multi_ext.recording.RecordingFormatError) as ex:
+        parser.error('Cannot replay "{}": {}'.format(args['replay'], str(ex)))
+
+    return {
+        'timeout': header['timeout'],
+        'ping': [(hostname, 'true') for hostname in header['hosts']],
+    }
+
 def parse_argv():
     parser = ping_multi_ext.lib.argv_parser_base(
         'Ping all hosts from FILE and HOSTs.'
@@ -69,9 +96,37 @@ def parse_argv():
     parser.add_argument('-L', '--count-limit', dest='count_limit', type=int, default=dval,
         help=f'limit the number of hosts; avoids unintended bulk actions; default={dval}')
 
+    parser.add_argument('-x', '--exclude', metavar='HOST', action='append', default=[],
+        help='do not ping HOST, which can also be a network or a range of addresses; ' +\
+             'you can specify this option many times')
+
     parser.add_argument('-C', '--comments-as-sep', action='store_true',
         help=f'display comments as separators. Ignore comments starting with ##')
 
+    dval = 'ping'
+    parser.add_argument('--engine', choices=['ping', 'native', 'fping'], default=dval,
+        help='how to ping local hosts: "ping" starts one external "ping" command per host; ' +\
+             '"native" sends the probes from this process using unprivileged ICMP sockets ' +\
+             '(see the "net.ipv4.ping_group_range" sysctl) and falls back to "ping" ' +\
+             'if they are not permitted; "fping" starts a single "fping" command for all local hosts; ' +\
+             f'default={dval}')
+
+    parser.add_argument('--resolve', action='store_true',
+        help='resolve the names of the local hosts in parallel before starting, ping their addresses, ' +\
+             'and show the addresses next to the names')
+
+    parser.add_argument('--ssh-mux', action='store_true',
+        help='run the pings of all "host@location" entries with the same location ' +\
+             'in a single SSH session, instead of one SSH session per host')
+
+    parser.add_argument('--replay', metavar='FILE', default=None,
+        help='replay a session recorded with --record instead of pinging; ' +\
+             'the hosts are taken from the recording')
+
+    dval = 1
+    parser.add_argument('--speed', type=ping_multi_ext.lib.positive_float_type, default=dval,
+        help=f'replay the recording this many times faster than real time; default={dval}')
+
     parser.add_argument('host', nargs='*',
         help='host to ping; you can specify this option many times')
 
@@ -82,31 +137,113 @@ def parse_argv():
             args['wait'], args['interval']
         ))
 
-    hosts = []
-    for host in _iter_host_candidates(args):
-        host = _parse_host_token(host, args['comments_as_sep'])
-        if host is None:
-            continue
+    common_args = {
+        'hosts_max_width': args['hosts_max_width'],
+        'stats_show_initially': args['stats_show_initially'],
+        'history_limit': args['history_limit'],
+        'max_fps': args['max_fps'],
+        'headless': args['headless'],
+        'output': args['output'],
+        'metrics_listen': args['metrics_listen'],
+        'record': args['record'],
+        'record_raw': args['record_raw'],
+        'profile_out': args['profile_out'],
+        'replay': args['replay'],
+        'speed': args['speed'],
+        'workers': args['workers'],
+    }
 
-        hosts.append(host)
+    if args['replay'] is not None:
+        if args['workers'] is not None:
+            parser.error('Argument "--workers" cannot be used together with --replay')
+        return {
+            **common_args,
+            **_parse_replay_argv(args, parser),
+            'spawn_rate': None,
+            'native': None,
+            'ssh_mux': None,
+        }
 
-    hosts = expand_hosts_cidr(hosts, args, parser)
+    hosts = (_parse_host_token(host, args['comments_as_sep']) for host in _iter_host_candidates(args))
+    hosts = list(expand_hosts((host for host in hosts if host is not None), args, parser))
 
     if not len(hosts):
         parser.error('No hosts were specified')
 
+    # the remote hosts are resolved by their own location
+    addresses = {}
+    host_labels = {}
+    if args['resolve']:
+        resolved = ping_multi_ext.resolve.resolve_all(
+            host for host in hosts if ping_multi_ext.lib.is_local_host(host)
+        )
+        for (host, (address, error)) in resolved.items():
+            if address is None:
+                host_labels[host] = f'{host} (unresolved)' # "ping" reports the error
+            elif address != host:
+                addresses[host] = address
+                host_labels[host] = f'{host} ({address})'
+
     ping_args = []
+    native_targets = {}
     for host in hosts:
+        hostname = ping_multi_ext.lib.remove_ssh_user(host)
+        target = addresses.get(host, host)
         ping_args.append((
-            ping_multi_ext.lib.remove_ssh_user(host),
-            ping_multi_ext.lib.compose_ping_cmd(host, args),
+            hostname,
+            ping_multi_ext.lib.compose_ping_cmd(target, args),
         ))
+        if ping_multi_ext.lib.is_local_host(host):
+            native_targets[hostname] = target
+
+    ssh_mux = None
+    if args['ssh_mux']:
+        locations = {} # location -> [host, ...], in the order of appearance
+        for host in hosts:
+            if host.startswith('#') or '@' not in host:
+                continue
+            locations.setdefault(host.split('@', 1)[1], []).append(host)
+
+        ssh_mux = []
+        for location, location_hosts in locations.items():
+            ssh_mux.append({
+                'cmdline': ping_multi_ext.lib.compose_ssh_mux_cmd(location, location_hosts, args),
+                'hosts': [ping_multi_ext.lib.remove_ssh_user(host) for host in location_hosts],
+            })
+
+    spawn_rate = args['spawn_rate']
+    if spawn_rate is None:
+        # start the hosts evenly over one interval, so that their probes don't go in bursts
+        spawn_rate = len(hosts) / args['interval']
+
+    fping = None
+    if args['engine'] == 'fping':
+        if shutil.which('fping') is None:
+            parser.error('Argument "--engine=fping" needs the "fping" command, which was not found')
+        fping = {
+            'options': ping_multi_ext.lib.compose_fping_options(args),
+            'hosts': list(native_targets),
+            'targets': list(native_targets.values()),
+        }
+
+    if args['engine'] == 'native':
+        native = {
+            'interval': args['interval'],
+            'targets': native_targets,
+        }
+    else:
+        native = None
 
     return {
+        **common_args,
         'timeout': args['wait'],
-        'hosts_max_width': args['hosts_max_width'],
-        'stats_show_initially': args['stats_show_initially'],
+        'spawn_rate': spawn_rate,
         'ping': ping_args,
+        'host_labels': host_labels,
+        'native': native,
+        'ssh_mux': ssh_mux,
+        'fping': fping,
+        'parser': 'fping' if fping is not None else 'ping',
     }
 
 def main():
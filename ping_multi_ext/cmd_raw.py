@@ -1,5 +1,6 @@
 import ping_multi_ext.lib
 import ping_multi_ext.core
+import ping_multi_ext.parser
 
 def parse_argv():
     parser = ping_multi_ext.lib.argv_parser_base(
@@ -12,6 +13,11 @@ def parse_argv():
     parser.add_argument('--timeout', type=float, default=dval,
         help=f'ping reply timeout in seconds; default={dval}')
 
+    dval = 'ping'
+    parser.add_argument('--parser', choices=list(ping_multi_ext.parser.LINE_PARSERS), default=dval,
+        help='how to parse the output of the commands: "ping" for "ping" from iputils or BusyBox; ' +\
+             f'"fping" for "fping -l", and any "ping" output too; default={dval}')
+
     # required
 
     parser.add_argument('--ping', nargs=2, metavar=('UNIQUE_NAME', 'COMMAND'),
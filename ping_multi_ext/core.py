@@ -9,11 +9,43 @@ import string
 import math
 import ping_multi_ext.proc
 import ping_multi_ext.lib
+import ping_multi_ext.history
+import ping_multi_ext.host
+import ping_multi_ext.headless
+import ping_multi_ext.metrics
+import ping_multi_ext.recording
+import ping_multi_ext.profiling
+import ping_multi_ext.search
+import ping_multi_ext.shard
 from collections import deque
 import os
 
 gvars = {}
 
+# Wakes up a thread which waits for new data or key presses.
+# Notifications which arrive while nobody waits are not lost.
+class Notifier:
+    def __init__(self):
+        self.cond = threading.Condition() # re-entrant, so it's safe in signal handlers too
+        self.pending = False
+
+    def notify(self):
+        with self.cond:
+            self.pending = True
+            self.cond.notify_all()
+
+    # returns False if nothing happened within the timeout
+    def wait(self, timeout):
+        with self.cond:
+            if not self.pending:
+                self.cond.wait(timeout)
+            notified = self.pending
+            self.pending = False
+        return notified
+
+class StdinWakeupEvent(curtsies.events.Event):
+    pass
+
 class TermCtrl:
     def __init__(self, key):
         self.code = getattr(gvars['term'], key)
@@ -79,7 +111,9 @@ def ui_print(term, data):
 
     if 'ui_old_screen' not in gvars:
         gvars['ui_old_screen'] = {}
+        gvars['ui_old_rows'] = {}
     old_screen = gvars['ui_old_screen']
+    old_rows = gvars['ui_old_rows'] # the "data" rows of the last call
 
     screen_changed = False
     for i in range(0, t_height):
@@ -91,6 +125,10 @@ def ui_print(term, data):
         except IndexError:
             data_row = ['']
 
+        if data_row is old_rows.get(i):
+            continue # the very same row object as last time, e.g. from the host rows cache
+        old_rows[i] = data_row
+
         _sanity_check_data_row(data_row, i)
 
         printed_str = _compose_printed_str(data_row, t_width)
@@ -159,6 +197,60 @@ def _get_display_value(raw_value):
 
     return (added_value, value_meta)
 
+# The rendered history of a host, newest first, cut to the available width.
+# It is updated incrementally with the samples which arrived since the last
+# update, and rebuilt from scratch only when the time scale or the width change.
+class ParsedStrip:
+    def __init__(self):
+        self.key = None
+        self.cells = deque() # the display value of each sample
+        self.cells_len = 0
+        self.seen_total = 0 # how many samples of the history we have processed
+        self.newest_is_error = False
+        self.text = ''
+
+    def update(self, parsed, time_scale, avail_width):
+        key = (time_scale, avail_width)
+        total = parsed.total()
+        new_cnt = total - self.seen_total
+
+        if not new_cnt and key == self.key:
+            return # nothing changed
+
+        if key != self.key or new_cnt > avail_width or new_cnt > len(parsed):
+            self._rebuild(parsed, avail_width)
+            self.key = key
+        else:
+            for v_idx in range(new_cnt, 0, -1): # from the oldest to the newest one
+                (added_value, value_meta) = _get_display_value(ping_multi_ext.host.decode_pd(parsed[-v_idx]))
+
+                self.cells.appendleft(added_value)
+                self.cells_len += len(added_value)
+                self.newest_is_error = 'error' in value_meta and len(added_value) > 0
+
+            # keep only the newest values which fit and are still in the history
+            while len(self.cells) and (self.cells_len > avail_width or len(self.cells) > len(parsed)):
+                self.cells_len -= len(self.cells.pop())
+
+        self.seen_total = total
+        self.text = ''.join(self.cells)
+
+    def _rebuild(self, parsed, avail_width):
+        self.cells.clear()
+        self.cells_len = 0
+
+        for v_idx in range(1, len(parsed) + 1): # from the newest to the oldest one
+            (added_value, value_meta) = _get_display_value(ping_multi_ext.host.decode_pd(parsed[-v_idx]))
+
+            if v_idx == 1:
+                self.newest_is_error = 'error' in value_meta and len(added_value) > 0
+
+            if self.cells_len + len(added_value) > avail_width:
+                break
+
+            self.cells.append(added_value)
+            self.cells_len += len(added_value)
+
 def _compose_host_data_parsed_str(hostname, host_data, t_width, selected):
     row_parts = []
     row_parts_str_len = 0
@@ -167,7 +259,7 @@ def _compose_host_data_parsed_str(hostname, host_data, t_width, selected):
         row_parts.append(TermCtrl('bold'))
 
     host_id_str = ('{:<' + str(gvars['config']['max_host_id_len']) + 's} ').format(
-        hostname[0:gvars['config']['max_host_id_len']]
+        _host_label(hostname)[0:gvars['config']['max_host_id_len']]
     )
     row_parts.append(TermCtrl('white')) # we will replace this on error
     row_parts_host_color_id = len(row_parts) - 1
@@ -175,40 +267,65 @@ def _compose_host_data_parsed_str(hostname, host_data, t_width, selected):
     row_parts.append(TermCtrl('white'))
     row_parts_str_len += len(host_id_str)
 
-    s = ''
-    with host_data['lock']:
-        stats_val = host_data['stats'][gvars['stats_show'][0]]
-        if stats_val is None:
-            stats_val = ''
+    # no lock: a single statistic is read atomically, and the history through a snapshot
+    stats_val = host_data.stat(gvars['stats_show'][0])
+    if stats_val is None:
+        stats_val = ''
 
-        if hostname.startswith('#'): # 'comments_as_sep' in effect
-            stats_val = ''
+    if hostname.startswith('#'): # 'comments_as_sep' in effect
+        stats_val = ''
 
-        stats_str = ('{:>6}  '.format(stats_val))
-        row_parts.append(stats_str)
-        row_parts_str_len += len(stats_str)
+    stats_str = ('{:>6}  '.format(stats_val))
+    row_parts.append(stats_str)
+    row_parts_str_len += len(stats_str)
 
-        for v_idx in range(1, len(host_data['parsed']) + 1):
-            (added_value, value_meta) = _get_display_value(host_data['parsed'][-v_idx])
+    if hostname.startswith('#'): # 'comments_as_sep' in effect
+        row_parts[row_parts_host_color_id] = TermCtrl('cyan')
+        s = ''
+    else:
+        strip = gvars['ui_strips'].get(hostname)
+        if strip is None:
+            strip = ParsedStrip()
+            gvars['ui_strips'][hostname] = strip
+
+        while True:
+            try:
+                strip.update(
+                    host_data.parsed.snapshot(), gvars['time_scale'][0], t_width - row_parts_str_len
+                )
+                break
+            except ping_multi_ext.history.StaleReadError:
+                strip.key = None # the collector dropped what we were reading; rebuild
 
-            if v_idx == 1 and 'error' in value_meta and len(added_value):
-                row_parts[row_parts_host_color_id] = TermCtrl('red')
+        if strip.newest_is_error:
+            row_parts[row_parts_host_color_id] = TermCtrl('red')
+        s = strip.text
+    row_parts.append(s)
 
-            if hostname.startswith('#'): # 'comments_as_sep' in effect
-                row_parts[row_parts_host_color_id] = TermCtrl('cyan')
-                added_value = ''
+    return row_parts
 
-            if len(s) + len(added_value) > t_width - row_parts_str_len:
-                break
+# Recompose the row of a host only if its data or the way it's displayed changed.
+# The collector increments "generation" each time it touches the host data.
+# We read it before the data, so an update which races with us is only
+# picked up by the next frame, never lost.
+def _compose_host_data_parsed_row(hostname, host_data, t_width, selected):
+    cache_key = (
+        host_data.generation, selected,
+        gvars['stats_show'][0], gvars['time_scale'][0], t_width,
+    )
 
-            s += added_value
-    row_parts.append(s)
+    cached = gvars['ui_rows_cache'].get(hostname)
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+
+    row_parts = _compose_host_data_parsed_str(hostname, host_data, t_width, selected)
+    gvars['ui_rows_cache'][hostname] = (cache_key, row_parts)
 
     return row_parts
 
 def _ui_render_all_hosts_data(
         screen_rows, all_hosts, host_data_type,
-        min_idx, max_idx, sel_idx, sel_hostname, t_width
+        min_idx, max_idx, sel_idx, sel_hostname, t_width, raw_history=None
     ):
         if host_data_type == 'parsed':
             for idx, hostname in enumerate(list(gvars['hosts_print_order'])):
@@ -217,25 +334,36 @@ def _ui_render_all_hosts_data(
                 if idx > max_idx:
                     continue
 
-                screen_rows.append(_compose_host_data_parsed_str(
+                screen_rows.append(_compose_host_data_parsed_row(
                     hostname, all_hosts[hostname],
                     t_width, sel_idx == idx
                 ))
         elif host_data_type == 'raw':
-            for idx, data_row in enumerate(list(all_hosts[sel_hostname]['raw'])):
-                if idx < min_idx:
-                    continue
-                if idx > max_idx:
-                    continue
-                
+            if raw_history is None:
+                raw_history = all_hosts[sel_hostname].raw.snapshot()
+
+            # only the visible lines, however long the history is
+            while True:
+                try:
+                    raw_lines = [
+                        raw_history[idx] for idx in range(min_idx, min(max_idx + 1, len(raw_history)))
+                    ]
+                    break
+                except ping_multi_ext.history.StaleReadError:
+                    raw_history = all_hosts[sel_hostname].raw.snapshot()
+
+            for idx, data_row in enumerate(raw_lines, min_idx):
                 safe_s = str(data_row)
                 for c in ['\n', '\r', '\t']:
                     safe_s = safe_s.replace(c, ' ')
-                screen_rows.append(safe_s)
+                if idx == sel_idx: # the current search match
+                    screen_rows.append([TermCtrl('reverse'), safe_s])
+                else:
+                    screen_rows.append(safe_s)
         else:
             raise NotImplementedError(host_data_type)
 
-def _ui_render_header(screen_rows, cmd_err, host_data_type, sel_hostname):
+def _ui_render_header(screen_rows, cmd_err, host_data_type, sel_hostname, search_status=''):
     first_row = [
         'Keys: ',
     ]
@@ -264,6 +392,13 @@ def _ui_render_header(screen_rows, cmd_err, host_data_type, sel_hostname):
             TermCtrl('bold'), 'End', TermCtrl('normal'),
             '/',
             TermCtrl('bold'), 'ESC', TermCtrl('normal'),
+            ' | ',
+            TermCtrl('bold'), '/', TermCtrl('normal'),
+            'search (',
+            TermCtrl('bold'), 'n', TermCtrl('normal'),
+            '/',
+            TermCtrl('bold'), 'N', TermCtrl('normal'),
+            ')',
         ])
 
     if host_data_type == 'parsed':
@@ -300,7 +435,9 @@ def _ui_render_header(screen_rows, cmd_err, host_data_type, sel_hostname):
             res_header
         )
     elif host_data_type == 'raw':
-        screen_rows.append([TermCtrl('bold'), f'Raw ping results for "{sel_hostname}"'])
+        screen_rows.append([
+            TermCtrl('bold'), f'Raw ping results for "{_host_label(sel_hostname)}"', TermCtrl('normal'), search_status
+        ])
     else:
         raise NotImplementedError(host_data_type)
 
@@ -392,6 +529,21 @@ class DataScroller:
         self.min_idx = max(0, self.max_idx - self.avail_term_rows + 1)
         self.sel_idx = None
 
+    # the oldest "n" data items were removed, so move the view to keep showing the same items
+    def shift(self, n):
+        if not n or not self.initialized or self.in_tail_mode:
+            return
+
+        self.min_idx = max(0, self.min_idx - n)
+        self.update_max_id()
+
+    # scroll so that the data item "idx" is at the top, or as near as possible
+    def show(self, idx):
+        self.in_tail_mode = False
+        self.min_idx = max(0, min(idx, self.data_items_count - self.avail_term_rows))
+        self.update_max_id()
+        self.sel_idx = None
+
     def key_enter(self):
         if self.sel_idx is None:
             return None
@@ -402,6 +554,51 @@ class DataScroller:
     def _align_value_to(self, src_value, aligned_to_value):
         return int(math.ceil(src_value / (aligned_to_value * 1.0)) * aligned_to_value)
 
+def _wait_for_next_frame():
+    # Sleep until new data arrives or a key is pressed. The timeout is only a safety net,
+    # a terminal resize wakes us up as well.
+    gvars['ui_notifier'].wait(1)
+
+    # coalesce a burst of updates into a single frame
+    min_frame_interval = 1.0 / gvars['cmd_args']['max_fps']
+    since_last_frame = time.monotonic() - gvars['ui_last_frame_at']
+    if since_last_frame < min_frame_interval:
+        time.sleep(min_frame_interval - since_last_frame)
+
+    gvars['ui_last_frame_at'] = time.monotonic()
+
+# Cover the bottom rows of the screen with the latest profile results.
+def _add_profile_overlay(screen_rows, t_height):
+    lines = ping_multi_ext.profiling.format_report(gvars['profiler'].latest)
+    lines.append('Press "P" to hide')
+
+    rows_cnt = max(0, t_height - len(lines))
+    screen_rows = screen_rows[:rows_cnt]
+    while len(screen_rows) < rows_cnt:
+        screen_rows.append([''])
+
+    for line in lines:
+        screen_rows.append([TermCtrl('reverse'), line])
+
+    return screen_rows
+
+def _raw_search_status(search, raw_history):
+    status = f'  Search "{search.pattern}": {search.count(raw_history)} matches'
+    if not search.caught_up:
+        status += ', indexing...'
+    return status
+
+def _start_raw_search(raw_history, pattern):
+    search = ping_multi_ext.search.RawSearchIndex(raw_history, pattern)
+    _stop_raw_search()
+    gvars['raw_search'] = search
+    threading.Thread(name='raw_search', target=thread_runner, args=(raw_search_indexer, search)).start()
+
+def _stop_raw_search():
+    if gvars['raw_search'] is not None:
+        gvars['raw_search'].stop()
+        gvars['raw_search'] = None
+
 def ui_renderer(all_hosts):
     term = gvars['term']
 
@@ -421,24 +618,48 @@ def ui_renderer(all_hosts):
         'raw': DataScroller(None, True),
     }
     switched_host_data_type = False
+    raw_dropped = None
+    search_prompt = None # the search pattern while it's being typed
+    search_pos = None # the absolute position of the current search match
+    search_jump = None # the direction of a pending jump to a search match
+    prof_frame = ping_multi_ext.profiling.duration('frame')
+    frame_started = None
 
     with term.hidden_cursor():
         while not gvars['stop_run']:
+            if gvars['profiler'].overlay:
+                screen_rows = _add_profile_overlay(screen_rows, term.height)
+
             term_size_changed, t_height, t_width = ui_print(term, screen_rows)
 
+            if frame_started is not None:
+                prof_frame.add(time.perf_counter() - frame_started)
+
             if not term_size_changed:
-                time.sleep(0.05)
+                _wait_for_next_frame()
 
+            frame_started = time.perf_counter()
             screen_rows = []
 
-            _ui_render_header(screen_rows, cmd_err, host_data_type, sel_hostname)
+            search_status = ''
+            if host_data_type == 'raw' and gvars['raw_search'] is not None:
+                search_status = _raw_search_status(gvars['raw_search'], all_hosts[sel_hostname].raw.snapshot())
+
+            _ui_render_header(screen_rows, cmd_err, host_data_type, sel_hostname, search_status)
 
             scroller = scroller_registry[host_data_type]
 
             if host_data_type == 'parsed':
                 scroller.set_data_items_count(len(gvars['hosts_print_order']))
             elif host_data_type == 'raw':
-                scroller.set_data_items_count(len(all_hosts[sel_hostname]['raw']))
+                raw_history = all_hosts[sel_hostname].raw.snapshot()
+                scroller.set_data_items_count(len(raw_history))
+                if switched_host_data_type:
+                    raw_dropped = None
+                if raw_dropped is not None:
+                    # history limit in effect: keep the view on the same lines
+                    scroller.shift(raw_history.dropped - raw_dropped)
+                raw_dropped = raw_history.dropped
             else:
                 raise NotImplementedError(host_data_type)
 
@@ -458,7 +679,30 @@ def ui_renderer(all_hosts):
                     cmd_err = ['']
 
                     min_idx_updated = False
-                    if key == '<DOWN>' and host_data_type == 'parsed':
+                    if search_prompt is not None:
+                        if key == '<ENTER>':
+                            if len(search_prompt):
+                                try:
+                                    _start_raw_search(all_hosts[sel_hostname].raw, search_prompt)
+                                except ping_multi_ext.search.SearchPatternError as ex:
+                                    cmd_err = [TermCtrl('bold'), TermCtrl('red'), str(ex)]
+                                else:
+                                    search_pos = None
+                                    # in tail mode, the newest match is the most interesting one
+                                    search_jump = -1 if scroller.in_tail_mode else 1
+                            search_prompt = None
+                            continue
+                        elif key == '<ESC>':
+                            search_prompt = None
+                            continue
+                        elif key in ['<BACKSPACE>', '<Ctrl-h>']:
+                            search_prompt = search_prompt[:-1]
+                        elif key == '<SPACE>':
+                            search_prompt += ' '
+                        elif len(key) == 1 and key in string.printable:
+                            search_prompt += key
+                        cmd_err = ['/', search_prompt, TermCtrl('reverse'), ' ']
+                    elif key == '<DOWN>' and host_data_type == 'parsed':
                         scroller.key_down()
                     elif key == '<UP>' and host_data_type == 'parsed':
                         scroller.key_up()
@@ -484,9 +728,19 @@ def ui_renderer(all_hosts):
 
                             switched_host_data_type = True
                             break # mandatory restart
+                    elif key == '/' and host_data_type == 'raw':
+                        search_prompt = ''
+                        cmd_err = ['/', search_prompt, TermCtrl('reverse'), ' ']
+                    elif key in ['n', 'N'] and host_data_type == 'raw':
+                        if gvars['raw_search'] is None:
+                            cmd_err = [TermCtrl('bold'), TermCtrl('red'), 'Press "/" to search first']
+                        else:
+                            search_jump = 1 if key == 'n' else -1
                     elif key == '<ESC>':
                         if host_data_type == 'raw':
                             host_data_type = 'parsed'
+                            _stop_raw_search()
+                            (search_prompt, search_pos, search_jump) = (None, None, None)
 
                             switched_host_data_type = True
                             break # mandatory restart
@@ -500,8 +754,10 @@ def ui_renderer(all_hosts):
                         gvars['time_scale'].rotate(-1)
                     elif key == 'T' and host_data_type == 'parsed':
                         gvars['time_scale'].rotate(1)
+                    elif key == 'P': # hidden, for developers
+                        gvars['profiler'].overlay = not gvars['profiler'].overlay
                     elif key.lower() == 'q':
-                        gvars['stop_run'] = True
+                        request_stop()
                     else:
                         if not all(c in string.printable for c in key):
                             # key = '0x' + binascii.hexlify(key.encode('ascii')).decode('ascii')
@@ -510,12 +766,41 @@ def ui_renderer(all_hosts):
                             key = f' "{key}"'
                         cmd_err = [TermCtrl('bold'), TermCtrl('red'), f'Unknown key command{key}']
 
+            screen_rows[1] = cmd_err # the keys may have changed it; see _ui_render_header()
+
             if switched_host_data_type:
                 continue # mandatory restart
 
+            if search_jump is not None and gvars['raw_search'] is not None:
+                if search_pos is not None:
+                    from_pos = search_pos
+                elif search_jump > 0: # from the top of the screen
+                    from_pos = raw_history.dropped + scroller.min_idx - 1
+                else: # from the bottom of the screen
+                    from_pos = raw_history.dropped + scroller.max_idx + 1
+
+                (found, final) = gvars['raw_search'].find(raw_history, from_pos, search_jump > 0)
+                if found is not None and final:
+                    search_pos = found
+                    scroller.show(found - raw_history.dropped)
+                    search_jump = None
+                elif final:
+                    cmd_err = [
+                        TermCtrl('bold'), TermCtrl('red'), f'Pattern not found: {gvars["raw_search"].pattern}'
+                    ]
+                    screen_rows[1] = cmd_err
+                    search_jump = None
+                # else: wait until the matches up to there are indexed
+
             if host_data_type == 'raw':
+                if gvars['raw_search'] is not None:
+                    gvars['raw_search'].wakeup() # index the new lines
                 scroller.tail()
 
+            sel_raw_idx = None
+            if host_data_type == 'raw' and search_pos is not None:
+                sel_raw_idx = search_pos - raw_history.dropped
+
             if scroller.max_idx < 0:
                 # terminal is so small that it doesn't have any space for data, or there
                 # is no data
@@ -524,7 +809,9 @@ def ui_renderer(all_hosts):
             _ui_render_all_hosts_data(
                 screen_rows, all_hosts, host_data_type,
                 scroller.min_idx, scroller.max_idx,
-                scroller.sel_idx, sel_hostname, t_width
+                scroller.sel_idx if host_data_type == 'parsed' else sel_raw_idx,
+                sel_hostname, t_width,
+                raw_history if host_data_type == 'raw' else None
             )
 
     # only this thread and Exceptions print any info
@@ -544,11 +831,12 @@ def exit_fullscreen():
         _exit_fullscreen()
 
 def thread_runner(*args):
+    ping_multi_ext.profiling.register_thread()
     try:
         func = args[0]
         func(*args[1:])
     except:
-        gvars['stop_run'] = True
+        request_stop()
 
         if threading.current_thread() != gvars['ui_renderer_thread']:
             # this thread must exit very soon, because of the gvars['stop_run'] == False
@@ -561,10 +849,12 @@ def thread_runner(*args):
 
 def stdin_processor():
     with curtsies.Input() as input_generator:
+        gvars['stdin_wakeup'] = input_generator.threadsafe_event_trigger(StdinWakeupEvent)
+
         while not gvars['stop_run']:
-            e = input_generator.send(0.05)
-            if e is None:
-                continue # nothing pressed within the timeout period
+            e = input_generator.send(1) # the timeout is only a safety net; see request_stop()
+            if e is None or isinstance(e, StdinWakeupEvent):
+                continue # nothing pressed
 
             with gvars['keys_pressed_lock']:
                 key = str(e)
@@ -573,10 +863,46 @@ def stdin_processor():
 
                 gvars['keys_pressed_list'].append(key)
 
-def sigint_handler(a, b):
+            gvars['ui_notifier'].notify()
+
+# Can be called from any thread and from signal handlers.
+# The main thread then wakes up all other threads, so that they can exit.
+def request_stop():
     gvars['stop_run'] = True
+    if 'stop_pipe_w' in gvars:
+        os.write(gvars['stop_pipe_w'], b'.')
+
+def _wake_up_all_threads():
+    gvars['ui_notifier'].notify()
+    if gvars['metrics_server'] is not None:
+        gvars['metrics_server'].shutdown()
+    if 'workflow' in gvars:
+        gvars['workflow'].wakeup()
+    if 'stdin_wakeup' in gvars:
+        gvars['stdin_wakeup']()
+    if gvars.get('raw_search') is not None:
+        gvars['raw_search'].stop()
+
+def sigint_handler(a, b):
+    request_stop()
+
+def sigwinch_handler(a, b):
+    gvars['ui_notifier'].notify() # redraw for the new terminal size
+
+def _new_history(initial_items, typecode=None):
+    limit = gvars['cmd_args']['history_limit']
+    history = ping_multi_ext.history.RingBuffer(limit['lines'], limit['secs'], typecode=typecode)
+    for item in initial_items:
+        history.append(item)
+    return history
+
+# the hostname with its address; see "--resolve"
+def _host_label(hostname):
+    return gvars['host_labels'].get(hostname, hostname)
 
 def populate_hosts():
+    gvars['host_labels'] = gvars['cmd_args'].get('host_labels') or {}
+
     ret = {}
     for hostname, cmd in gvars['cmd_args']['ping']:
         if hostname in ret:
@@ -584,28 +910,13 @@ def populate_hosts():
                 print(f'Error: Duplicate unique name: {hostname}', file=sys.stderr, flush=True)
                 sys.exit(1)
 
-        ret[hostname] = {
-            'proc': {
-                'cmdline': cmd,
-                'pid': None,
-            },
-            'lock': threading.Lock(),
-            'stats': {},
-            'parsed': [''],
-            'raw': [''],
-            'raw_complete': False,
-            'seen_rx_seq': {},
-        }
-        
-        for k in gvars['stats_show']:
-            if not k.endswith('_cnt'):
-                ret[hostname]['stats'][k] = None
-            else:
-                ret[hostname]['stats'][k] = 0
+        ret[hostname] = ping_multi_ext.host.HostState(
+            cmd, _new_history([ping_multi_ext.host.PD_NONE], 'i'), _new_history([''])
+        )
 
         gvars['hosts_print_order'].append(hostname)
 
-    max_hostname_len = len(max(gvars['hosts_print_order'], key=len))
+    max_hostname_len = max(len(_host_label(hostname)) for hostname in gvars['hosts_print_order'])
 
     if gvars['config']['auto_max_host_id_len']: # fit as much as needed
         gvars['config']['max_host_id_len'] = max_hostname_len
@@ -619,12 +930,110 @@ def populate_hosts():
 
     return ret
 
+def _new_workflow():
+    if gvars['cmd_args'].get('replay') is not None:
+        workflow = ping_multi_ext.recording.ReplayWorkflow(
+            gvars['proc_data'], gvars['cmd_args']['timeout'],
+            gvars['cmd_args']['replay'], gvars['cmd_args']['speed']
+        )
+    elif gvars['cmd_args'].get('workers') is not None:
+        workflow = ping_multi_ext.shard.ShardedWorkflow(
+            gvars['proc_data'], gvars['cmd_args']['timeout'],
+            gvars['cmd_args'].get('native'), gvars['cmd_args']['spawn_rate'],
+            gvars['cmd_args'].get('ssh_mux'), gvars['cmd_args']['workers'],
+            gvars['cmd_args'].get('fping'), gvars['cmd_args'].get('parser') or 'ping'
+        )
+    else:
+        workflow = ping_multi_ext.proc.Workflow(
+            gvars['proc_data'], gvars['cmd_args']['timeout'],
+            gvars['cmd_args'].get('native'), gvars['cmd_args']['spawn_rate'],
+            gvars['cmd_args'].get('ssh_mux'), gvars['cmd_args'].get('fping'),
+            gvars['cmd_args'].get('parser') or 'ping'
+        )
+    if gvars.get('metrics') is not None:
+        workflow.add_sample_listener(gvars['metrics'].add_sample)
+    workflow.profiler = gvars.get('profiler')
+    if gvars.get('recorder') is not None:
+        workflow.add_sample_listener(gvars['recorder'].add_sample)
+        if gvars['recorder'].record_raw:
+            workflow.add_raw_listener(gvars['recorder'].add_raw_line)
+    gvars['workflow'] = workflow
+    return workflow
+
+def _start_profiler():
+    path = gvars['cmd_args'].get('profile_out')
+    try:
+        gvars['profiler'] = ping_multi_ext.profiling.Profiler(path)
+    except OSError as ex:
+        print(f'Error: Cannot write the profile to "{path}": {ex.strerror}', file=sys.stderr, flush=True)
+        sys.exit(1)
+
+    ping_multi_ext.profiling.register_thread()
+
+def _start_recorder():
+    gvars['recorder'] = None
+
+    path = gvars['cmd_args']['record']
+    if path is None:
+        return
+
+    try:
+        gvars['recorder'] = ping_multi_ext.recording.Recorder(
+            path, gvars['hosts_print_order'], gvars['cmd_args']['timeout'],
+            gvars['cmd_args']['record_raw']
+        )
+    except OSError as ex:
+        print(f'Error: Cannot record to "{path}": {ex.strerror}', file=sys.stderr, flush=True)
+        sys.exit(1)
+
+def _open_headless_output():
+    gvars['headless_output'] = None
+
+    if not gvars['cmd_args']['headless']:
+        return
+
+    path = gvars['cmd_args']['output']
+    if path == '-':
+        gvars['headless_output'] = sys.stdout
+        return
+
+    try:
+        gvars['headless_output'] = open(path, 'a', buffering=1024 * 1024)
+    except OSError as ex:
+        print(f'Error: Cannot write to "{path}": {ex.strerror}', file=sys.stderr, flush=True)
+        sys.exit(1)
+
+def _start_metrics_server():
+    gvars['metrics'] = None
+    gvars['metrics_server'] = None
+
+    address = gvars['cmd_args']['metrics_listen']
+    if address is None:
+        return
+
+    gvars['metrics'] = ping_multi_ext.metrics.MetricsExporter(
+        gvars['proc_data'], gvars['hosts_print_order']
+    )
+    try:
+        gvars['metrics_server'] = ping_multi_ext.metrics.start_server(gvars['metrics'], address)
+    except OSError as ex:
+        print(f'Error: Cannot listen on "{address[0]}:{address[1]}": {ex.strerror}', file=sys.stderr, flush=True)
+        sys.exit(1)
+
 def update_hosts_data():
-    workflow = ping_multi_ext.proc.Workflow(gvars['proc_data'], gvars['cmd_args']['timeout'])
+    workflow = _new_workflow()
     workflow.start_all_processes()
 
     while not gvars['stop_run']:
-        workflow.update_hosts_data(0.05)
+        # the timeout is only a safety net; see request_stop()
+        if workflow.update_hosts_data(1):
+            gvars['ui_notifier'].notify()
+
+def raw_search_indexer(search):
+    while not gvars['stop_run'] and not search.stopped:
+        # the timeout is only a safety net; see RawSearchIndex.wakeup()
+        if search.update(1):
+            gvars['ui_notifier'].notify()
 
 def _global_pre_init():
     gvars['stats_show'] = deque(ping_multi_ext.lib.statistics_list())
@@ -646,6 +1055,9 @@ def _main():
     gvars['term'] = Terminal()
 
     gvars['stop_run'] = False
+    (gvars['stop_pipe_r'], gvars['stop_pipe_w']) = os.pipe()
+    gvars['ui_notifier'] = Notifier()
+    gvars['ui_last_frame_at'] = 0
 
     gvars['keys_pressed_list'] = []
     gvars['keys_pressed_lock'] = threading.Lock()
@@ -655,6 +1067,10 @@ def _main():
 
     gvars['time_scale'] = deque(['success', 'raw', 'numbered'])
 
+    gvars['ui_rows_cache'] = {}
+    gvars['ui_strips'] = {}
+    gvars['raw_search'] = None
+
     gvars['ui_renderer_thread'] = threading.Thread(name='ui_renderer', target=thread_runner, args=(
         ui_renderer, gvars['proc_data']
     ))
@@ -666,12 +1082,13 @@ def _main():
     ]
 
     signal.signal(signal.SIGINT, sigint_handler) # CTRL+C
+    signal.signal(signal.SIGWINCH, sigwinch_handler)
 
     for thr in thr_list:
         thr.start()
 
-    while not gvars['stop_run']:
-        time.sleep(0.05)
+    os.read(gvars['stop_pipe_r'], 1) # blocks until request_stop()
+    _wake_up_all_threads()
 
     while threading.active_count() > 1:
         for thr in thr_list:
@@ -679,11 +1096,17 @@ def _main():
                 thr.join()
         time.sleep(0.05)
 
+    _kill_ping_processes()
+
+def _kill_ping_processes():
+    if isinstance(gvars.get('workflow'), ping_multi_ext.shard.ShardedWorkflow):
+        gvars['workflow'].stop_workers()
+
     for host_data in gvars['proc_data'].values():
-        if not host_data['proc']['pid']:
+        if not host_data.pid:
             continue
         try:
-            os.kill(host_data['proc']['pid'], signal.SIGTERM)
+            os.kill(host_data.pid, signal.SIGTERM)
         except ProcessLookupError:
             pass
 
@@ -694,4 +1117,20 @@ def main(cmd_args):
     gvars['hosts_print_order'] = []
     _global_pre_init()
     gvars['proc_data'] = populate_hosts()
-    thread_runner(_main)
+    _open_headless_output()
+    _start_metrics_server()
+    _start_recorder()
+    _start_profiler()
+
+    try:
+        if cmd_args['headless']:
+            try:
+                ping_multi_ext.headless.run(_new_workflow(), gvars['headless_output'])
+            finally:
+                _kill_ping_processes()
+        else:
+            thread_runner(_main)
+    finally:
+        if gvars['recorder'] is not None:
+            gvars['recorder'].close()
+        gvars['profiler'].close()
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import signal
+
+# Streams one JSON Lines record per probe result. The records are formatted
+# by hand and collected in a list, which is written out with a single
+# write() call once enough records have accumulated or enough time passed.
+class JsonLinesWriter:
+    def __init__(self, f, flush_interval=0.5, max_buffered=4096):
+        self.f = f
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.buf = []
+        self.last_flush = time.monotonic()
+        self.host_json = {} # cache of the JSON-encoded host names
+
+    def add_sample(self, hostname, kind, seq, rtt, is_timeout, ts):
+        host_json = self.host_json.get(hostname)
+        if host_json is None:
+            host_json = json.dumps(hostname)
+            self.host_json[hostname] = host_json
+
+        if type(rtt) is not int:
+            rtt = 'null'
+
+        self.buf.append(
+            '{{"ts":{:.3f},"host":{},"seq":{},"rtt":{},"timeout":{},"kind":"{}"}}\n'.format(
+                ts, host_json, 'null' if seq is None else seq, rtt,
+                'true' if is_timeout else 'false', kind
+            )
+        )
+
+        if len(self.buf) >= self.max_buffered:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+
+        if not len(self.buf):
+            return
+
+        self.f.write(''.join(self.buf))
+        self.f.flush()
+        self.buf = []
+
+    def flush_if_due(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+# "f" is the open output file, or "sys.stdout"; it's closed at the end
+def run(workflow, f):
+    stop_run = False
+
+    def stop_handler(a, b):
+        nonlocal stop_run
+        stop_run = True
+        workflow.wakeup()
+
+    signal.signal(signal.SIGINT, stop_handler)
+    signal.signal(signal.SIGTERM, stop_handler)
+
+    try:
+        writer = JsonLinesWriter(f)
+        workflow.add_sample_listener(writer.add_sample)
+        workflow.start_all_processes()
+
+        while not stop_run and not workflow.is_finished():
+            workflow.update_hosts_data(writer.flush_interval)
+            writer.flush_if_due()
+
+        writer.flush()
+    except BrokenPipeError: # the reader of our output went away
+        # avoid another BrokenPipeError when Python flushes "stdout" at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), f.fileno())
+    finally:
+        if f is not sys.stdout:
+            f.close()
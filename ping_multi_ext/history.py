@@ -0,0 +1,166 @@
+import time
+from array import array
+
+# Append-only history with an optional retention limit in items and/or seconds.
+#
+# The items live in a circular buffer, which starts small and doubles its
+# capacity whenever it gets full and the oldest item is still too young to
+# be dropped. When "max_len" is set, the capacity stops growing at it, and
+# then the oldest item is overwritten by each new append.
+#
+# With a "typecode", the items are stored in an "array" of that type instead
+# of a list, which takes a fraction of the memory for numbers.
+#
+# Indexes are relative to the oldest retained item, so "[0]" is the oldest
+# and "[-1]" is the newest item. The "dropped" counter tells how many items
+# were evicted from the front since the beginning.
+#
+# One thread appends, and other threads can read the history without a lock
+# through snapshot(). The writer publishes its state as a single tuple after
+# each change, and always counts an item as dropped before it reuses its slot,
+# so a reader can tell when an item changed under it.
+class RingBuffer:
+    __slots__ = (
+        'max_len', 'max_age', 'clock', 'typecode',
+        '_capacity', '_items', '_stamps', '_head', '_len', 'dropped', '_state',
+    )
+
+    def __init__(self, max_len=None, max_age=None, clock=time.monotonic, typecode=None):
+        if max_len is not None and max_len < 1:
+            raise ValueError(f'Invalid max_len: {max_len}')
+
+        self.max_len = max_len
+        self.max_age = max_age
+        self.clock = clock
+        self.typecode = typecode
+
+        self._capacity = min(max_len, 4) if max_len else 4 # most hosts have little history
+        self._items = self._new_items(self._capacity)
+        if max_age is not None:
+            self._stamps = array('d', bytes(8 * self._capacity))
+        else:
+            self._stamps = None
+        self._head = 0 # physical index of the oldest item
+        self._len = 0
+        self.dropped = 0
+        self._publish()
+
+    def _new_items(self, count):
+        if self.typecode is None:
+            return [None] * count
+        return array(self.typecode, [0]) * count
+
+    def _publish(self):
+        self._state = (self._items, self._capacity, self._head, self._len, self.dropped)
+
+    def snapshot(self):
+        return RingSnapshot(self, self._state)
+
+    def __len__(self):
+        return self._len
+
+    def _pindex(self, idx):
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError('RingBuffer index out of range')
+        return (self._head + idx) % self._capacity
+
+    def __getitem__(self, idx):
+        return self._items[self._pindex(idx)]
+
+    def __setitem__(self, idx, value):
+        self._items[self._pindex(idx)] = value
+
+    def __iter__(self):
+        for idx in range(self._len):
+            yield self._items[(self._head + idx) % self._capacity]
+
+    def total(self):
+        return self.dropped + self._len
+
+    def _drop_oldest(self):
+        self.dropped += 1 # first, see snapshot()
+        if self.typecode is None:
+            self._items[self._head] = None # release the reference
+        self._head = (self._head + 1) % self._capacity
+        self._len -= 1
+
+    def _grow(self):
+        items = self._new_items(0)
+        items.extend(self)
+        if self._stamps is not None:
+            old_stamps = [self._stamps[(self._head + idx) % self._capacity] for idx in range(self._len)]
+
+        self._capacity *= 2
+        if self.max_len:
+            self._capacity = min(self._capacity, self.max_len)
+        items.extend(self._new_items(self._capacity - len(items)))
+        self._items = items
+        if self._stamps is not None:
+            self._stamps = array('d', old_stamps)
+            self._stamps.extend(array('d', bytes(8 * (self._capacity - len(old_stamps)))))
+        self._head = 0
+
+    def expire(self, now=None):
+        if self.max_age is None:
+            return
+
+        if now is None:
+            now = self.clock()
+
+        # always keep the newest item, so that "[-1]" stays valid
+        dropped = self.dropped
+        while self._len > 1 and now - self._stamps[self._head] > self.max_age:
+            self._drop_oldest()
+        if self.dropped != dropped:
+            self._publish()
+
+    def append(self, value):
+        now = None
+        if self.max_age is not None:
+            now = self.clock()
+            self.expire(now)
+
+        if self._len == self._capacity:
+            if self._capacity == self.max_len:
+                self._drop_oldest()
+            else:
+                self._grow()
+
+        pidx = (self._head + self._len) % self._capacity
+        self._items[pidx] = value
+        if self._stamps is not None:
+            self._stamps[pidx] = now
+        self._len += 1
+        self._publish()
+
+class StaleReadError(Exception):
+    pass
+
+# The history as it was at the time of RingBuffer.snapshot(), with the same
+# indexes. Taking it is O(1) as it shares the items with the buffer. Reading
+# an item which the writer dropped since then raises StaleReadError, and the
+# reader should retry with a new snapshot. The newest item can still change
+# in place; see RingBuffer.__setitem__().
+class RingSnapshot:
+    def __init__(self, buf, state):
+        self.buf = buf
+        (self._items, self._capacity, self._head, self._len, self.dropped) = state
+
+    def __len__(self):
+        return self._len
+
+    def total(self):
+        return self.dropped + self._len
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError('RingSnapshot index out of range')
+
+        value = self._items[(self._head + idx) % self._capacity]
+        if self.buf.dropped > self.dropped + idx:
+            raise StaleReadError(f'Item {idx} was dropped after the snapshot')
+        return value
@@ -0,0 +1,117 @@
+import math
+import ping_multi_ext.lib
+import ping_multi_ext.stats
+import ping_multi_ext.profiling
+
+# Each sample in the "parsed" history is an int: the RTT in milliseconds,
+# or one of these negative codes. So the history can be an array('i').
+PD_NONE = -1 # the empty first item, before any sample
+PD_TIMEOUT = -2
+PD_ERROR = -3
+PD_EXIT = -4
+PD_RTT_ERR = -5 # the RTT value could not be converted; see PingLineParser
+
+# the codes of the values which the UI shows
+_pd_codes = {
+    '': PD_NONE,
+    '*': PD_TIMEOUT,
+    '???': PD_ERROR,
+    'EXIT': PD_EXIT,
+    'ERR': PD_RTT_ERR,
+}
+_pd_values = {code: value for (value, code) in _pd_codes.items()}
+
+def encode_pd(value):
+    if type(value) is int:
+        return value
+    return _pd_codes[value]
+
+# the RTT as an int, or one of the strings above
+def decode_pd(code):
+    if code >= 0:
+        return code
+    return _pd_values[code]
+
+# The state of one host, as updated by the collector and shown by the UI.
+#
+# There is one per host from the start, so __slots__ keep it small. The
+# statistics are kept as numbers and formatted only when they are shown;
+# see stat().
+class HostState:
+    __slots__ = (
+        'cmdline', 'pid', 'out_fd', 'lock',
+        'tx_cnt', 'rx_cnt', 'dup_cnt', 'ooo_cnt', 'late_cnt', 'last',
+        'rtt_stats', 'rtt_hist', 'rtt_jitter',
+        'parsed', 'raw', 'raw_complete', 'generation', 'seq_window',
+    )
+
+    def __init__(self, cmdline, parsed, raw, lock=None, rtt_hist=None):
+        self.cmdline = cmdline
+        self.pid = None
+        self.out_fd = None
+        self.lock = lock if lock is not None else ping_multi_ext.profiling.ProfiledLock()
+        self.tx_cnt = 0
+        self.rx_cnt = 0
+        self.dup_cnt = 0 # duplicate replies
+        self.ooo_cnt = 0 # replies which came after the reply to a newer probe
+        self.late_cnt = 0 # replies which came after a timeout or an error of their probe
+        self.last = None # the code of the last result, or None after a line which had none
+        self.rtt_stats = ping_multi_ext.stats.RunningStats()
+        self.rtt_hist = rtt_hist if rtt_hist is not None else ping_multi_ext.stats.LogHistogram()
+        self.rtt_jitter = ping_multi_ext.stats.JitterEstimator()
+        self.parsed = parsed
+        self.raw = raw
+        self.raw_complete = False
+        self.generation = 0 # incremented on each update
+        self.seq_window = ping_multi_ext.stats.SeqWindow()
+
+    def add_rtt(self, rtt):
+        self.rtt_stats.add(rtt)
+        self.rtt_hist.add(rtt)
+        self.rtt_jitter.add(rtt)
+
+    # The value of one of lib.statistics_list(), as shown by the UI, or None.
+    # It's called without the lock, so the collector may be in the middle of
+    # an update; that's only visible until the next update of the host.
+    def stat(self, name):
+        if name == 'Last':
+            last = self.last
+            return decode_pd(last) if last is not None else None
+        if name == 'TX_cnt':
+            return self.tx_cnt
+        if name == 'RX_cnt':
+            return self.rx_cnt
+        if name == 'XX_cnt':
+            return self.tx_cnt - self.rx_cnt
+        if name == 'DUP_cnt':
+            return self.dup_cnt
+        if name == 'OOO_cnt':
+            return self.ooo_cnt
+        if name == 'LATE_cnt':
+            return self.late_cnt
+        if name == 'Loss%':
+            (tx_cnt, rx_cnt) = (self.tx_cnt, self.rx_cnt)
+            if not tx_cnt:
+                return None
+            return '{:.0f}%'.format((1 - rx_cnt / tx_cnt) * 100)
+        if name == 'Jitter':
+            jitter = self.rtt_jitter.jitter
+            return '{:.1f}'.format(jitter) if jitter is not None else None
+
+        percentile = ping_multi_ext.lib.percentile_statistics().get(name)
+        if percentile is not None:
+            return self.rtt_hist.percentile(percentile)
+
+        rtt_stats = self.rtt_stats
+        if not rtt_stats.count: # read again below, but it only grows
+            return None
+        if name == 'Avg':
+            return round(rtt_stats.mean())
+        if name == 'Min':
+            return rtt_stats.min
+        if name == 'Max':
+            return rtt_stats.max
+        if name == 'StDev':
+            # the fields may be in the middle of an update; see stat()
+            return '{:.1f}'.format(math.sqrt(max(0, rtt_stats.pvariance())))
+        raise ValueError(name)
@@ -0,0 +1,179 @@
+import socket
+import struct
+import time
+import heapq
+
+# In-process ICMP Echo probes which use the Linux "ping sockets"
+# (SOCK_DGRAM + IPPROTO_ICMP). They need no privileges as long as the
+# group of the process is within the "net.ipv4.ping_group_range" sysctl.
+#
+# The kernel fills in the ICMP identifier and checksum, and delivers to
+# each socket only the replies to its own requests. We use one connected
+# socket per host, which makes demultiplexing trivial.
+#
+# The output is formatted like the one of "ping -O" from iputils, so that
+# it goes through the very same parsing and statistics as the subprocess path.
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+# /usr/include/linux/in.h; not exported by older Python versions
+IP_RECVTTL = getattr(socket, 'IP_RECVTTL', 12)
+
+PAYLOAD_SIZE = 56 # the default of "ping"
+_payload_fmt = struct.Struct('!d')
+_payload_padding = bytes(PAYLOAD_SIZE - _payload_fmt.size)
+_icmp_hdr_fmt = struct.Struct('!BBHHH') # type, code, checksum, identifier, sequence
+
+class NativePingNotPermitted(Exception):
+    pass
+
+def _format_rtt(rtt_ms):
+    # the same precision as iputils
+    if rtt_ms >= 100:
+        return '{:.0f}'.format(rtt_ms)
+    elif rtt_ms >= 10:
+        return '{:.1f}'.format(rtt_ms)
+    else:
+        return '{:.3f}'.format(rtt_ms)
+
+class NativePinger:
+    def __init__(self, target, interval, clock=time.monotonic):
+        self.target = target
+        self.interval = interval
+        self.clock = clock
+
+        # raises socket.gaierror if the name cannot be resolved
+        (family, _, _, _, sockaddr) = socket.getaddrinfo(target, None, 0, socket.SOCK_DGRAM)[0]
+        self.family = family
+        self.address = sockaddr[0]
+
+        if family == socket.AF_INET6:
+            proto = socket.IPPROTO_ICMPV6
+            self.echo_request_type = ICMPV6_ECHO_REQUEST
+            self.echo_reply_type = ICMPV6_ECHO_REPLY
+        else:
+            proto = socket.IPPROTO_ICMP
+            self.echo_request_type = ICMP_ECHO_REQUEST
+            self.echo_reply_type = ICMP_ECHO_REPLY
+
+        try:
+            self.sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+        except OSError as ex:
+            raise NativePingNotPermitted(str(ex))
+
+        self.sock.setblocking(False)
+        if family == socket.AF_INET6:
+            self.sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_RECVHOPLIMIT, 1)
+        else:
+            self.sock.setsockopt(socket.IPPROTO_IP, IP_RECVTTL, 1)
+        self.sock.connect(sockaddr)
+
+        self.seq = 0 # the last sent sequence number
+        self.answered = True # whether the last sent sequence got a reply
+        self.next_send = None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def header(self):
+        return 'PING {} ({}) {}({}) bytes of data.\n'.format(
+            self.target, self.address, PAYLOAD_SIZE, PAYLOAD_SIZE + 28
+        )
+
+    # Send the next Echo Request and return the text lines which "ping -O" would print.
+    def send(self):
+        out = ''
+
+        if not self.answered:
+            out += f'no answer yet for icmp_seq={self.seq}\n'
+
+        self.seq = (self.seq + 1) & 0xffff # 16-bit on the wire, like "ping"
+        self.answered = False
+
+        packet = _icmp_hdr_fmt.pack(self.echo_request_type, 0, 0, 0, self.seq) + \
+            _payload_fmt.pack(self.clock()) + _payload_padding
+        try:
+            self.sock.send(packet)
+        except OSError as ex:
+            out += f'ping: sendmsg: {ex.strerror}\n'
+
+        return out
+
+    # Read all queued Echo Replies and return them formatted as "ping" lines.
+    def receive(self):
+        out = ''
+
+        while True:
+            try:
+                (data, ancdata, _, _) = self.sock.recvmsg(2048, socket.CMSG_SPACE(4))
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as ex:
+                out += f'ping: recvmsg: {ex.strerror}\n'
+                break
+
+            now = self.clock()
+
+            if len(data) < _icmp_hdr_fmt.size + _payload_fmt.size:
+                continue
+            (icmp_type, _, _, _, seq) = _icmp_hdr_fmt.unpack_from(data)
+            if icmp_type != self.echo_reply_type:
+                continue
+            (sent_at,) = _payload_fmt.unpack_from(data, _icmp_hdr_fmt.size)
+
+            ttl = '' # left out if unknown, as the parser allows
+            for (cmsg_level, cmsg_type, cmsg_data) in ancdata:
+                if cmsg_type in (socket.IP_TTL, socket.IPV6_HOPLIMIT) and len(cmsg_data) >= 4:
+                    ttl = ' ttl={}'.format(struct.unpack('i', cmsg_data[:4])[0])
+
+            if seq == self.seq:
+                self.answered = True
+
+            out += '{} bytes from {}: icmp_seq={}{} time={} ms\n'.format(
+                len(data), self.address, seq, ttl, _format_rtt((now - sent_at) * 1000)
+            )
+
+        return out
+
+# A single timer queue which drives all native pingers.
+class NativeScheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.queue = []
+        self.counter = 0 # tie-breaker, so that pingers are never compared
+
+    def add(self, pinger, start_at):
+        pinger.next_send = start_at
+        heapq.heappush(self.queue, (start_at, self.counter, pinger))
+        self.counter += 1
+
+    # how long we can sleep until the next probe is due
+    def time_to_next(self, now=None):
+        if not self.queue:
+            return None
+        if now is None:
+            now = self.clock()
+        return max(0, self.queue[0][0] - now)
+
+    # pop all pingers whose probe is due and reschedule them
+    def pop_due(self, now=None):
+        if now is None:
+            now = self.clock()
+
+        due = []
+        while self.queue and self.queue[0][0] <= now:
+            (send_at, _, pinger) = heapq.heappop(self.queue)
+            due.append(pinger)
+
+            next_send = send_at + pinger.interval
+            if next_send < now: # we fell behind; don't send a burst to catch up
+                next_send = now + pinger.interval
+            self.add(pinger, next_send)
+
+        return due
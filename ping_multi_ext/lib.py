@@ -3,9 +3,76 @@ import shlex
 import ping_multi_ext # version
 import ipaddress
 import re
+import bisect
+import socket
+import functools
 
 def statistics_list():
-    return ['Last', 'Loss%', 'Avg', 'Min', 'Max', 'StDev', 'RX_cnt', 'TX_cnt', 'XX_cnt']
+    return [
+        'Last', 'Loss%', 'Avg', 'Min', 'Max', 'StDev', 'P50', 'P90', 'P99', 'Jitter',
+        'RX_cnt', 'TX_cnt', 'XX_cnt', 'DUP_cnt', 'OOO_cnt', 'LATE_cnt'
+    ]
+
+# These are not kept in the "stats" dict of a host but are computed on
+# demand from its RTT histogram. The value is the percentile to compute.
+def percentile_statistics():
+    return {'P50': 50, 'P90': 90, 'P99': 99}
+
+# Parse "--history-limit" values like "10000", "30m" or "10000,2h".
+# Plain numbers are a count of lines; a "s", "m", "h" or "d" suffix sets an age limit.
+def history_limit_type(value):
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    limit = {'lines': None, 'secs': None}
+
+    for part in value.split(','):
+        part = part.strip()
+        try:
+            if part[-1:] in units:
+                key = 'secs'
+                part_value = float(part[:-1]) * units[part[-1]]
+            else:
+                key = 'lines'
+                part_value = int(part)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid history limit: "{part}"')
+
+        if part_value <= 0:
+            raise argparse.ArgumentTypeError(f'history limit must be positive: "{part}"')
+        if limit[key] is not None:
+            raise argparse.ArgumentTypeError(f'history limit specified twice: "{part}"')
+
+        limit[key] = part_value
+
+    return limit
+
+def positive_float_type(value):
+    try:
+        value = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid number: "{value}"')
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f'must be positive: "{value}"')
+    return value
+
+def positive_int_type(value):
+    try:
+        value = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid integer: "{value}"')
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f'must be positive: "{value}"')
+    return value
+
+# Parse "ADDR:PORT", "[IPV6]:PORT" or ":PORT" (all IPv4 addresses) into an (addr, port) tuple.
+def listen_address_type(value):
+    (addr, sep, port) = value.rpartition(':')
+    if not sep or not port.isdigit() or not 0 < int(port) < 65536:
+        raise argparse.ArgumentTypeError(f'invalid address, expected ADDR:PORT: "{value}"')
+
+    if addr.startswith('[') and addr.endswith(']'):
+        addr = addr[1:-1]
+
+    return (addr, int(port))
 
 def argv_parser_base(prog_desc):
     parser = argparse.ArgumentParser(
@@ -27,9 +94,53 @@ def argv_parser_base(prog_desc):
         default=dval,
         help=f'statistic to display initially; default={dval}')
 
+    parser.add_argument('--history-limit', metavar='LIMIT', type=history_limit_type,
+        default={'lines': None, 'secs': None},
+        help='keep only the last N lines and/or the lines of the last N seconds of history per host, ' +\
+             'e.g. "10000", "30m" or "10000,2h"; statistics still cover the whole run; default=unlimited')
+
+    dval = 20
+    parser.add_argument('--max-fps', type=positive_float_type, default=dval,
+        help=f'maximum number of screen updates per second; default={dval}')
+
+    parser.add_argument('--spawn-rate', metavar='PER_SEC', type=positive_float_type, default=None,
+        help='start at most PER_SEC hosts per second; this staggers the ping probes and ' +\
+             'avoids a burst of SSH connections; ' +\
+             'default="ping-multi" spreads the start of all hosts over one --interval, ' +\
+             '"ping-raw-multi" starts them all at once')
+
+    parser.add_argument('--workers', metavar='N', type=positive_int_type, default=None,
+        help='split the hosts over N worker processes which run and parse the "ping" commands, ' +\
+             'so that thousands of hosts can use more than one CPU core; ' +\
+             'default=all hosts are handled by this process')
+
+    parser.add_argument('--headless', action='store_true',
+        help='do not start the interactive UI; stream one JSON Lines record per probe result')
+
+    dval = '-'
+    parser.add_argument('-o', '--output', metavar='FILE', default=dval,
+        help=f'append the "--headless" records to FILE; "-" means the standard output; default={dval}')
+
+    parser.add_argument('--metrics-listen', metavar='ADDR:PORT', type=listen_address_type, default=None,
+        help='serve the statistics of all hosts in the Prometheus text format at "http://ADDR:PORT/metrics"')
+
+    parser.add_argument('--record', metavar='FILE', default=None,
+        help='write every probe result to FILE in a compact binary format; see --replay of "ping-multi"')
+
+    parser.add_argument('--record-raw', action='store_true',
+        help='also write the raw output lines of the hosts to the --record FILE')
+
+    parser.add_argument('--profile-out', metavar='FILE', default=None,
+        help='append the CPU usage of each thread, the duration of the collector loop and of the ' +\
+             'screen updates, the lock wait times, and the processed lines per second to FILE, ' +\
+             'as one JSON Lines record per second')
+
     return parser
 
 def remove_ssh_user(host):
+    if '@' not in host: # the common case
+        return host
+
     parts = host.split('@', 2)
     
     if len(parts) == 3:
@@ -37,17 +148,25 @@ def remove_ssh_user(host):
 
     return '@'.join(parts)
 
+# not a comment nor an SSH "host@location" entry
+def is_local_host(host):
+    return not host.startswith('#') and '@' not in host
+
+# the same for all hosts, so composed only once
+@functools.lru_cache(maxsize=None)
+def _plain_ping_cmd_prefix(wait, interval):
+    return 'ping -O -W {} -i {} '.format(shlex.quote(str(wait)), shlex.quote(str(interval)))
+
+def _compose_plain_ping_cmd(target, cmd_args):
+    return _plain_ping_cmd_prefix(cmd_args['wait'], cmd_args['interval']) + shlex.quote(target)
+
 def compose_ping_cmd(host, cmd_args):
     if host.startswith('#'): # 'comments_as_sep' in effect
         return 'true' # '/bin/true' simply exits immediately with no output
 
     parts = host.split('@', 1)
 
-    ping_cmd = 'ping -O -W {} -i {} {}'.format(
-        shlex.quote(str(cmd_args['wait'])),
-        shlex.quote(str(cmd_args['interval'])),
-        shlex.quote(parts[0])
-    )
+    ping_cmd = _compose_plain_ping_cmd(parts[0], cmd_args)
 
     if len(parts) > 1:
         return 'ssh -o BatchMode=yes {} {}'.format(
@@ -57,6 +176,43 @@ def compose_ping_cmd(host, cmd_args):
     else:
         return ping_cmd
 
+# Run all "ping" commands for one SSH location in a single remote session.
+#
+# Each "ping" gets an ID which is its index in "hosts". The remote shell
+# prefixes every output line with "ID:", and when a "ping" exits, it prints
+# "ID:\x01STATUS". Each line is written by a single printf(), so the lines
+# of the concurrent "ping" commands are never mixed up.
+SSH_MUX_SEP = ':'
+SSH_MUX_EXIT_MARK = '\x01'
+_ssh_mux_shell_func = (
+    'p() { id=$1; shift; '
+    '{ "$@" 2>&1; printf \'\\001%s\\n\' "$?"; } | '
+    'while IFS= read -r l; do printf \'%s:%s\\n\' "$id" "$l"; done; }'
+)
+
+def compose_ssh_mux_cmd(location, hosts, cmd_args):
+    script = [_ssh_mux_shell_func]
+    for idx, host in enumerate(hosts):
+        target = host.split('@', 1)[0]
+        script.append('p {} {} &'.format(idx, _compose_plain_ping_cmd(target, cmd_args)))
+    script.append('wait')
+
+    return 'ssh -o BatchMode=yes {} {}'.format(
+        shlex.quote(location),
+        shlex.quote('sh -c ' + shlex.quote('\n'.join(script)))
+    )
+
+# One "fping" probes all local hosts, in a loop ("-l"), one probe per
+# "interval". The options are kept apart from the targets, so that the
+# targets can be split between the "--workers".
+def compose_fping_options(cmd_args):
+    return 'fping -l -e -p {} -t {}'.format(
+        round(cmd_args['interval'] * 1000), round(cmd_args['wait'] * 1000)
+    )
+
+def compose_fping_cmd(options, targets):
+    return options + ' ' + ' '.join(shlex.quote(target) for target in targets)
+
 class CidrDebugError(Exception):
     pass
 
@@ -65,21 +221,125 @@ class NetworkTooBigError(Exception):
         super().__init__(message)
         self.num_addresses = num_addresses
 
-# if no IPv4 CIDR network is recognized, the original "host_input" is returned in a single list
-def expand_ipv4_network_to_hosts(host_input, debug, count_limit):
-    is_cidr = re.search(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}/\d+', host_input)
-    if not is_cidr:
-        return [host_input]
+_NETWORK_RE = re.compile(r'^(\d{1,3}(\.\d{1,3}){3}|[0-9a-fA-F:.]*:[0-9a-fA-F:.]*)/\d+')
+_RANGE_RE = re.compile(r'^(\d{1,3}(?:\.\d{1,3}){3}|[0-9a-fA-F:.]*:[0-9a-fA-F:.]*)-([0-9a-fA-F:.]+)$')
+
+def _parse_network(text, hosts_only):
+    net = ipaddress.ip_network(text, strict=False)
+    first = int(net.network_address)
+    last = int(net.broadcast_address)
+
+    if hosts_only: # the same as ipaddress' hosts()
+        if net.version == 4 and net.prefixlen < 31:
+            (first, last) = (first + 1, last - 1) # no network nor broadcast address
+        elif net.version == 6 and net.prefixlen < 127:
+            first += 1 # no Subnet-Router anycast address
+
+    return (net.version, first, last)
 
+def _parse_range(start_text, end_text):
+    start = ipaddress.ip_address(start_text)
+
+    if re.search(r'^[0-9a-fA-F]{1,4}$', end_text): # only the last octet or group
+        if start.version == 4:
+            if not end_text.isdigit() or int(end_text) > 255:
+                raise ValueError(f'Invalid end of the range "{start_text}-{end_text}"')
+            end = int(start) & ~0xff | int(end_text)
+        else:
+            end = int(start) & ~0xffff | int(end_text, 16)
+    else:
+        end_address = ipaddress.ip_address(end_text)
+        if end_address.version != start.version:
+            raise ValueError(f'Mixed IP versions in the range "{start_text}-{end_text}"')
+        end = int(end_address)
+
+    if end < int(start):
+        raise ValueError(f'The range "{start_text}-{end_text}" ends before it starts')
+
+    return (start.version, int(start), end)
+
+# Recognizes an IPv4 or IPv6 network ("10.0.0.0/24", "2001:db8::/120") or
+# a range of addresses ("10.0.0.1-200", "10.0.0.1-10.0.1.50", "2001:db8::1-ff").
+# Returns (IP version, first address, last address) with the addresses as
+# integers, or None if "host_input" is neither.
+def parse_address_range(host_input, debug, hosts_only=True):
     try:
-        net = ipaddress.IPv4Network(host_input, strict=False)
-    except Exception as ex:
+        if _NETWORK_RE.search(host_input):
+            return _parse_network(host_input, hosts_only)
+
+        m = _RANGE_RE.search(host_input)
+        if m:
+            return _parse_range(m.group(1), m.group(2))
+    except ValueError as ex:
         if debug:
             raise CidrDebugError(str(ex))
-        else:
-            return [host_input]
 
-    if net.num_addresses > count_limit:
-        raise NetworkTooBigError("Expanded network is too big", net.num_addresses)
+    return None
+
+def format_address(version, value):
+    if version == 4:
+        return socket.inet_ntoa(value.to_bytes(4, 'big')) # a lot faster than "ipaddress"
+    return str(ipaddress.IPv6Address(value))
+
+# Hostnames and IP addresses to skip. The addresses are kept as sorted ranges
+# which don't overlap, so excluding a whole network costs as much as
+# excluding a single address.
+class HostSet:
+    def __init__(self, entries, debug):
+        self.names = set()
+        ranges = {4: [], 6: []}
+
+        for entry in entries:
+            addr_range = parse_address_range(entry, debug, hosts_only=False)
+            if addr_range is None:
+                try:
+                    ip = ipaddress.ip_address(entry)
+                    addr_range = (ip.version, int(ip), int(ip))
+                except ValueError:
+                    self.names.add(entry)
+                    continue
+            ranges[addr_range[0]].append(addr_range[1:])
+
+        self.ranges = {}
+        for version, version_ranges in ranges.items():
+            merged = []
+            for (first, last) in sorted(version_ranges):
+                if len(merged) and first <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+                else:
+                    merged.append((first, last))
+            self.ranges[version] = (merged, [first for (first, _) in merged])
+
+    def contains_address(self, version, value):
+        (ranges, starts) = self.ranges[version]
+        idx = bisect.bisect_right(starts, value) - 1
+        return idx >= 0 and value <= ranges[idx][1]
+
+    def contains(self, host):
+        if host in self.names:
+            return True
+        try:
+            ip = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return self.contains_address(ip.version, int(ip))
+
+# Yields the addresses of "host_input" if it's a network or a range of
+# addresses, or else "host_input" itself, skipping the ones in "excluded".
+# The addresses are generated one by one, so a big network costs nothing
+# until it's consumed.
+def iter_network_hosts(host_input, debug, count_limit, excluded=None):
+    addr_range = parse_address_range(host_input, debug)
+    if addr_range is None:
+        if excluded is None or not excluded.contains(host_input):
+            yield host_input
+        return
+
+    (version, first, last) = addr_range
+    if last - first + 1 > count_limit:
+        raise NetworkTooBigError("Expanded network is too big", last - first + 1)
 
-    return [ str(ip_address) for ip_address in net.hosts() ]
+    for value in range(first, last + 1):
+        if excluded is not None and excluded.contains_address(version, value):
+            continue
+        yield format_address(version, value)
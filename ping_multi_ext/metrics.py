@@ -0,0 +1,169 @@
+import socket
+import threading
+import socketserver
+import http.server
+import ping_multi_ext.parser as parser
+
+# Upper bounds of the RTT histogram buckets, in milliseconds
+RTT_BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# (name, type, help) of each metric family, in the order of exposition
+_families = [
+    ('ping_multi_rtt_seconds', 'histogram', 'Round-trip time of the ping replies.'),
+    ('ping_multi_last_rtt_seconds', 'gauge', 'Round-trip time of the last ping reply.'),
+    ('ping_multi_sent_total', 'counter', 'Number of sent ping requests (TX_cnt).'),
+    ('ping_multi_received_total', 'counter', 'Number of ping replies within the timeout (RX_cnt).'),
+    ('ping_multi_unanswered', 'gauge', 'Number of ping requests without a reply within the timeout (XX_cnt).'),
+    ('ping_multi_loss_ratio', 'gauge', 'Ratio of the unanswered ping requests (Loss%).'),
+    ('ping_multi_duplicates_total', 'counter', 'Number of duplicate ping replies (DUP_cnt).'),
+    ('ping_multi_out_of_order_total', 'counter', 'Number of ping replies received after a newer one (OOO_cnt).'),
+    ('ping_multi_late_total', 'counter', 'Number of ping replies received after their timeout (LATE_cnt).'),
+]
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_seconds(ms):
+    return repr(ms / 1000)
+
+# Exposes the per-host statistics in the Prometheus text format.
+#
+# The RTT histogram is fed by the sample listener of the Workflow. The
+# listener also marks the host as "dirty". A scrape re-renders only the
+# dirty hosts, taking only their locks, and reuses the cached text of all
+# other hosts. If nothing changed, the previous response is returned as is.
+class MetricsExporter:
+    def __init__(self, hosts_data, hosts_order):
+        self.hosts_data = hosts_data
+        # comment separators are not hosts
+        self.hosts_order = [hostname for hostname in hosts_order if not hostname.startswith('#')]
+
+        self.rtt_hist = {} # hostname -> [bucket counts..., +Inf count, sum in ms]
+        self.host_chunks = {} # hostname -> [encoded text of each metric family]
+        self.host_labels = {}
+        for hostname in self.hosts_order:
+            self.rtt_hist[hostname] = [0] * (len(RTT_BUCKETS_MS) + 2)
+            self.host_labels[hostname] = 'host="{}"'.format(_escape_label(hostname))
+
+        self.dirty = set(self.hosts_order)
+        self.dirty_lock = threading.Lock()
+        self.render_lock = threading.Lock() # serializes concurrent scrapes
+        self.body = None
+
+    # Called by the Workflow with the lock of the host held.
+    def add_sample(self, hostname, kind, seq, rtt, is_timeout, ts):
+        hist = self.rtt_hist.get(hostname)
+        if hist is None:
+            return
+
+        if kind == parser.LINE_REPLY and type(rtt) is int:
+            for idx, bound in enumerate(RTT_BUCKETS_MS):
+                if rtt <= bound:
+                    hist[idx] += 1
+                    break
+            else:
+                hist[-2] += 1
+            hist[-1] += rtt
+
+        with self.dirty_lock:
+            self.dirty.add(hostname)
+
+    def _render_host(self, hostname):
+        labels = self.host_labels[hostname]
+        data = self.hosts_data[hostname]
+
+        with data.lock:
+            hist = list(self.rtt_hist[hostname])
+            last = data.last
+            tx_cnt = data.tx_cnt
+            rx_cnt = data.rx_cnt
+            xx_cnt = tx_cnt - rx_cnt
+            seq_cnts = (data.dup_cnt, data.ooo_cnt, data.late_cnt)
+
+        chunks = []
+
+        lines = []
+        cumulative = 0
+        for bound, cnt in zip(RTT_BUCKETS_MS, hist):
+            cumulative += cnt
+            lines.append('ping_multi_rtt_seconds_bucket{{{},le="{}"}} {}\n'.format(
+                labels, _format_seconds(bound), cumulative
+            ))
+        cumulative += hist[-2]
+        lines.append(f'ping_multi_rtt_seconds_bucket{{{labels},le="+Inf"}} {cumulative}\n')
+        lines.append(f'ping_multi_rtt_seconds_sum{{{labels}}} {_format_seconds(hist[-1])}\n')
+        lines.append(f'ping_multi_rtt_seconds_count{{{labels}}} {cumulative}\n')
+        chunks.append(''.join(lines))
+
+        if last is not None and last >= 0: # an RTT; see ping_multi_ext.host
+            chunks.append(f'ping_multi_last_rtt_seconds{{{labels}}} {_format_seconds(last)}\n')
+        else:
+            chunks.append('') # no reply yet, or the last probe timed out
+
+        chunks.append(f'ping_multi_sent_total{{{labels}}} {tx_cnt}\n')
+        chunks.append(f'ping_multi_received_total{{{labels}}} {rx_cnt}\n')
+        chunks.append(f'ping_multi_unanswered{{{labels}}} {xx_cnt}\n')
+        if tx_cnt > 0:
+            chunks.append(f'ping_multi_loss_ratio{{{labels}}} {repr(1 - rx_cnt / tx_cnt)}\n')
+        else:
+            chunks.append('')
+
+        for (name, cnt) in zip(('duplicates', 'out_of_order', 'late'), seq_cnts):
+            chunks.append(f'ping_multi_{name}_total{{{labels}}} {cnt}\n')
+
+        return [chunk.encode('utf-8') for chunk in chunks]
+
+    def render(self):
+        with self.render_lock:
+            with self.dirty_lock:
+                dirty = self.dirty
+                self.dirty = set()
+
+            if not len(dirty) and self.body is not None:
+                return self.body
+
+            for hostname in dirty:
+                self.host_chunks[hostname] = self._render_host(hostname)
+
+            parts = []
+            for idx, (name, mtype, mhelp) in enumerate(_families):
+                parts.append(f'# HELP {name} {mhelp}\n# TYPE {name} {mtype}\n'.encode('utf-8'))
+                for hostname in self.hosts_order:
+                    parts.append(self.host_chunks[hostname][idx])
+
+            self.body = b''.join(parts)
+            return self.body
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+
+        body = self.server.exporter.render()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # the terminal belongs to the UI
+
+# the same as http.server.ThreadingHTTPServer, which needs Python 3.7
+class _MetricsHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, exporter):
+        if ':' in address[0]:
+            self.address_family = socket.AF_INET6
+        self.exporter = exporter
+        super().__init__(address, _MetricsRequestHandler)
+
+# Start serving in a background thread; raises OSError if the address cannot be bound.
+def start_server(exporter, address):
+    server = _MetricsHTTPServer(address, exporter)
+    thr = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thr.start()
+    return server
@@ -0,0 +1,118 @@
+import re
+
+# Classification of a single line of "ping" output
+LINE_EMPTY = 'empty'
+LINE_HEADER = 'header'
+LINE_REPLY = 'reply'
+LINE_TIMEOUT = 'timeout'
+LINE_DUPLICATE = 'duplicate'
+LINE_ERROR = 'error'
+
+# Parses the output of "ping" from iputils, "ping" from BusyBox, and the
+# same when wrapped by SSH. Each line is classified by a cheap check of its
+# first character and then a single precompiled regular expression, which
+# also extracts "seq", "ttl" and "time".
+#
+# The lines are bytes, as read from the pipes, so that they are parsed
+# before and independently of decoding them for the raw history.
+#
+# parse() returns a tuple (kind, seq, ttl, rtt):
+#   - "seq" is the sequence number, or None
+#   - "ttl" is an int, or None
+#   - "rtt" is the RTT in whole milliseconds for replies and duplicates,
+#     "ERR" if the value cannot be converted, or None
+class PingLineParser:
+    # the usual format, so a single match gives us everything;
+    # "ttl" is missing if the native engine got no TTL from the kernel
+    _reply_re = re.compile(
+        rb'^\d+\sbytes\sfrom\s.*?\s(icmp_)?seq=(\d+)(?:\s+ttl=(\d+))?\s+time=([\d\.]+)\sms(\s\(DUP!\))?$'
+    )
+    # anything else which still looks like a reply
+    _reply_loose_re = re.compile(rb'^\d+\sbytes\sfrom\s.+?(?:\sttl=(\d+))?\s+time=([\d\.]+)\sms(\s\(DUP!\))?$')
+    _seq_re = re.compile(rb'\s(icmp_)?seq=(\d+)(?:\s|$)')
+    _header_re = re.compile(rb'^PING\s.+((bytes of data)|(data bytes))')
+    _timeout_re = re.compile(rb'^no answer yet for icmp_seq=(\d+)$')
+
+    def _parse_seq(self, is_icmp_seq, value):
+        seq = int(value)
+        if not is_icmp_seq:
+            # BusyBox prints "seq=" and counts from 0; iputils counts from 1
+            seq += 1
+        return seq
+
+    def _parse_ttl(self, value):
+        return int(value) if value is not None else None
+
+    def _parse_rtt(self, value):
+        try:
+            return round(float(value))
+        except ValueError:
+            return 'ERR' # this should never happen
+
+    def _search_seq(self, line):
+        if b'seq=' not in line:
+            return None
+        m = self._seq_re.search(line)
+        if not m:
+            return None
+        return self._parse_seq(m.group(1), m.group(2))
+
+    def parse(self, line):
+        line = line.strip()
+        if not len(line):
+            return (LINE_EMPTY, None, None, None)
+
+        first_c = line[:1]
+
+        if first_c.isdigit():
+            m = self._reply_re.match(line)
+            if m:
+                kind = LINE_DUPLICATE if m.group(5) else LINE_REPLY
+                return (
+                    kind, self._parse_seq(m.group(1), m.group(2)),
+                    self._parse_ttl(m.group(3)), self._parse_rtt(m.group(4))
+                )
+
+            m = self._reply_loose_re.match(line)
+            if m:
+                kind = LINE_DUPLICATE if m.group(3) else LINE_REPLY
+                return (kind, self._search_seq(line), self._parse_ttl(m.group(1)), self._parse_rtt(m.group(2)))
+        elif first_c == b'n':
+            m = self._timeout_re.match(line)
+            if m:
+                return (LINE_TIMEOUT, int(m.group(1)), None, None)
+        elif first_c == b'P':
+            if self._header_re.match(line):
+                return (LINE_HEADER, None, None, None)
+
+        return (LINE_ERROR, self._search_seq(line), None, None)
+
+# Parses the output of "fping -l" (also "-c" and "-C"), which prefixes each
+# line with its target and counts from 0:
+#   HOST : [SEQ], 64 bytes, 0.05 ms (0.05 avg, 0% loss)
+#   HOST : [SEQ], timed out (NaN avg, 100% loss)
+#   HOST : duplicate for [SEQ], 64 bytes, 0.07 ms
+# Any other line is parsed as "ping" output, so one parser also serves the
+# SSH-wrapped "ping" commands of the remote hosts.
+class FpingLineParser(PingLineParser):
+    _fping_re = re.compile(
+        rb'^\S+\s+:\s+(duplicate\sfor\s+)?\[(\d+)\],\s+(?:(timed\sout)|\d+\sbytes,\s+([\d\.]+)\sms)'
+    )
+
+    def parse(self, line):
+        if b' : ' in line:
+            m = self._fping_re.match(line.strip())
+            if m:
+                seq = int(m.group(2)) + 1
+                if m.group(3):
+                    return (LINE_TIMEOUT, seq, None, None)
+                kind = LINE_DUPLICATE if m.group(1) else LINE_REPLY
+                return (kind, seq, None, self._parse_rtt(m.group(4)))
+
+        return super().parse(line)
+
+# for "--parser"
+LINE_PARSERS = {
+    'ping': PingLineParser,
+    'fping': FpingLineParser,
+}
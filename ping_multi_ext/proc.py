@@ -5,21 +5,227 @@ import shlex
 from ctypes import cdll
 import time
 import signal
-import select
-import re
+import selectors
 import traceback
-import statistics
+import socket
+import shutil
+import subprocess
+import fcntl
+import termios
+import array
+import re
+from collections import deque
+import ping_multi_ext.icmp
+import ping_multi_ext.lib
+import ping_multi_ext.profiling
+import ping_multi_ext.parser as parser
+import ping_multi_ext.host
+import ping_multi_ext.stats
 
 # /usr/include/linux/prctl.h
 PR_SET_PDEATHSIG = 1
 
+_pdeathsig_helper = None
+
+# "setpriv" from util-linux (2.33+) sets PR_SET_PDEATHSIG and then exec()s the command.
+# We need it because no code of ours can run in a child started by posix_spawn().
+# Without posix_spawn() (Python 3.8+), the helper is not used and fork() is used.
+def find_pdeathsig_helper():
+    global _pdeathsig_helper
+
+    if _pdeathsig_helper is None:
+        _pdeathsig_helper = []
+
+        path = shutil.which('setpriv') if hasattr(os, 'posix_spawn') else None
+        if path is not None:
+            helper = [path, '--pdeathsig', 'TERM', '--']
+            try:
+                res = subprocess.run(helper + ['true'], stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except OSError:
+                pass
+            else:
+                if res.returncode == 0:
+                    _pdeathsig_helper = helper
+
+    return _pdeathsig_helper
+
+# the number of bytes which wait to be read from a pipe
+def readable_bytes(fd):
+    buf = array.array('i', [0])
+    try:
+        fcntl.ioctl(fd, termios.FIONREAD, buf, True)
+    except OSError:
+        return 0
+    return buf[0]
+
+# the most bytes which are read from a pipe at once
+READ_SIZE = 1024 * 1024
+
+# An incomplete line is shown in the raw history only up to this many bytes,
+# so that a long output without any "\n" is not decoded again on each read.
+PARTIAL_LINE_SHOWN_MAX = 4096
+
+# Splits the first "n" bytes of "buf" into complete lines, which continue
+# the incomplete line "partial" (a bytearray) of the previous reads. Returns
+# the complete lines as bytes, without "\n", and keeps the rest in "partial".
+def split_lines(buf, n, partial):
+    view = memoryview(buf)
+    end = buf.rfind(b'\n', 0, n) + 1
+    if not end:
+        partial += view[:n]
+        return []
+
+    if len(partial):
+        partial += view[:end]
+        lines = bytes(partial).split(b'\n')
+        partial.clear()
+    else:
+        lines = bytes(view[:end]).split(b'\n')
+    lines.pop() # the empty string after the last "\n"
+
+    if end < n:
+        partial += view[end:n]
+    return lines
+
+# Splits the output of one multiplexed SSH session into per-host output.
+# See compose_ssh_mux_cmd() for the format of the lines.
+class SshMuxStream:
+    _sep = ping_multi_ext.lib.SSH_MUX_SEP.encode('ascii')
+    _exit_mark = ping_multi_ext.lib.SSH_MUX_EXIT_MARK.encode('ascii')
+
+    def __init__(self, cmdline, hostnames):
+        self.cmdline = cmdline
+        self.hostnames = hostnames # the index is the ID of the host
+        self.running = set(hostnames)
+        self.pid = None
+
+    # Takes the complete lines of the output, as bytes; see split_lines().
+    # Returns a list of (hostname, line, exit_status); "exit_status" is None
+    # for output, and "line" is None for the exit marker.
+    def feed(self, lines):
+        events = []
+        for line in lines:
+            (host_id, sep, text) = line.partition(self._sep)
+            if not sep or not host_id.isdigit() or int(host_id) >= len(self.hostnames):
+                # not from the remote script, e.g. an SSH error; show it to all hosts
+                for hostname in self.hostnames:
+                    if hostname in self.running:
+                        events.append((hostname, line, None))
+                continue
+            hostname = self.hostnames[int(host_id)]
+
+            if text.startswith(self._exit_mark):
+                self.running.discard(hostname)
+                events.append((hostname, None, text[1:].decode('ascii', 'replace')))
+            else:
+                events.append((hostname, text, None))
+
+        return events
+
+# Splits the output of one "fping" for all local hosts into per-host output.
+# Each result line starts with the target, as given to "fping", and each
+# ICMP error ends with it. Anything else, e.g. an "fping" usage error, is
+# shown to all hosts.
+#
+# Several hosts may have the same target, e.g. two names of one address
+# with "--resolve". "fping" gets each target once, and its lines are shown
+# to all of these hosts.
+class FpingStream:
+    _sent_to_re = re.compile(rb'\ssent\sto\s(\S+)$')
+
+    def __init__(self, options, hostnames, targets):
+        self.cmdline = ping_multi_ext.lib.compose_fping_cmd(options, list(dict.fromkeys(targets)))
+        self.hostnames = hostnames
+        self.running = set(hostnames) # all of them, until "fping" exits; see SshMuxStream
+        self.target_lookup = {} # target as bytes, like the output lines -> [hostname, ...]
+        for (target, hostname) in zip(targets, hostnames):
+            self.target_lookup.setdefault(target.encode('ascii', 'replace'), []).append(hostname)
+        self.pid = None
+
+    # the hosts of the target of "line", or None
+    def _find_hostnames(self, line):
+        # "HOST : [0], ..." or "HOST: Name or service not known"
+        hostnames = self.target_lookup.get(line.split(b' ', 1)[0].rstrip(b':'))
+        if hostnames is None:
+            m = self._sent_to_re.search(line)
+            if m:
+                hostnames = self.target_lookup.get(m.group(1))
+        return hostnames
+
+    # the same as SshMuxStream.feed(), but "exit_status" is always None
+    def feed(self, lines):
+        events = []
+        for line in lines:
+            hostnames = self._find_hostnames(line)
+            if hostnames is None:
+                hostnames = self.hostnames
+            for hostname in hostnames:
+                events.append((hostname, line, None))
+
+        return events
+
 class Workflow:
-    def __init__(self, hosts_data, timeout):
+    def __init__(self, hosts_data, timeout, native=None, spawn_rate=None, ssh_mux=None, fping=None,
+            parser_name='ping'):
         self.debug = False
         self.hosts_data = hosts_data
         self.timeout = timeout
+        # start at most this many hosts per second; None or 0 means no limit
+        self.spawn_rate = spawn_rate
+        # an empty list means that we need to fork() and set PR_SET_PDEATHSIG ourselves
+        self.pdeathsig_helper = find_pdeathsig_helper()
+        # {'interval': SECS, 'targets': {hostname: target}} for the hosts which
+        # should be probed in-process instead of by an external "ping" command
+        self.native = native
+        # [{'cmdline': CMD, 'hosts': [hostname, ...]}, ...] for the hosts which
+        # share a single SSH session per location
+        self.ssh_mux = ssh_mux if ssh_mux is not None else []
+        # {'options': OPTIONS, 'hosts': [hostname, ...], 'targets': [target, ...]} for
+        # the hosts which are all probed by a single "fping"
+        self.fping = fping
+        # see parser.LINE_PARSERS
+        self.parser_name = parser_name
+        self.parser = parser.LINE_PARSERS[parser_name]()
+        self.sample_listeners = []
+        self.raw_listeners = []
+        self.updated = False
+        self.wall_clock = time.time # the timestamp of the samples; see ReplayWorkflow
+
+        self.profiler = None # set by the caller, if wanted
+        self.prof_loop = ping_multi_ext.profiling.duration('collector loop')
+        self.prof_bytes = ping_multi_ext.profiling.counter('collector bytes')
+        self.prof_lines = ping_multi_ext.profiling.counter('collector lines')
+
+        # a self-pipe which lets other threads (and signal handlers) interrupt the select()
+        (self.wakeup_r, self.wakeup_w) = os.pipe()
+        os.set_blocking(self.wakeup_r, False)
+        os.set_blocking(self.wakeup_w, False)
+
+    # "listener(hostname, kind, seq, rtt, is_timeout, ts)" is called from the collector
+    # thread, while holding the host lock, for each probe result: replies, duplicates,
+    # timeouts and errors which refer to a sequence number
+    def add_sample_listener(self, listener):
+        self.sample_listeners.append(listener)
+
+    def notify_sample(self, hostname, kind, seq, rtt):
+        if kind == parser.LINE_TIMEOUT:
+            is_timeout = True
+        elif type(rtt) is int:
+            is_timeout = rtt >= self.timeout * 1000
+        else:
+            is_timeout = False
+
+        ts = self.wall_clock()
+        for listener in self.sample_listeners:
+            listener(hostname, kind, seq, rtt, is_timeout, ts)
+
+    # "listener(hostname, line, ts)" is called like the sample listeners,
+    # for each complete output line of a host
+    def add_raw_listener(self, listener):
+        self.raw_listeners.append(listener)
 
-    def child_process(self, cmdline, ppid):
+    def child_process(self, args, ppid):
         # no effect for setuid or binaries with capabilities!
         errno = cdll['libc.so.6'].prctl(PR_SET_PDEATHSIG, signal.SIGTERM)
         if errno != 0:
@@ -29,11 +235,52 @@ class Workflow:
 
         os.close(0) # stdin
 
-        args = shlex.split(cmdline)
         os.execvp(args[0], args)
         # never returns
 
     def start_process(self, cmdline):
+        try:
+            args = shlex.split(cmdline)
+        except ValueError as ex:
+            return self.start_failed(f'shlex.split(): ValueError: {ex}')
+
+        if len(self.pdeathsig_helper):
+            return self.spawn_process(args)
+        else:
+            return self.fork_process(args)
+
+    # "pid" is None; the error message is the only output of this "process"
+    def start_failed(self, message):
+        (pipe_r, pipe_w) = os.pipe()
+        os.write(pipe_w, f'Fatal error: {message}\n'.encode('ascii', 'replace'))
+        os.close(pipe_w)
+
+        return None, pipe_r
+
+    # posix_spawn() is cheap and safe in a multi-threaded process, unlike fork()
+    # of the whole interpreter. The arguments are already split by the parent.
+    def spawn_process(self, args):
+        (pipe_r, pipe_w) = os.pipe() # not inherited: Python sets O_CLOEXEC
+
+        try:
+            pid = os.posix_spawn(
+                self.pdeathsig_helper[0], self.pdeathsig_helper + args, os.environ,
+                file_actions=[
+                    (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0), # stdin
+                    (os.POSIX_SPAWN_DUP2, pipe_w, 1), # stdout
+                    (os.POSIX_SPAWN_DUP2, pipe_w, 2), # stderr
+                ]
+            )
+        except OSError as ex:
+            os.close(pipe_r)
+            os.close(pipe_w)
+            return self.start_failed(f'posix_spawn(): {type(ex).__name__}: {ex}')
+
+        os.close(pipe_w)
+
+        return pid, pipe_r
+
+    def fork_process(self, args):
         (pipe_r, pipe_w) = os.pipe()
         parent_pid = os.getpid()
 
@@ -56,7 +303,7 @@ class Workflow:
             try:
                 # Only the following function must be in this try..except block
                 # because we always peek 2 tracebacks back upon exception.
-                self.child_process(cmdline, parent_pid)
+                self.child_process(args, parent_pid)
             except:
                 ex_type, ex_value, ex_traceback = sys.exc_info()
                 (tb_file, tb_line, tb_func, tb_text) = traceback.extract_tb(ex_traceback)[2]
@@ -69,167 +316,399 @@ class Workflow:
 
     def start_all_processes(self):
         self.fd_lookup = {}
-
+        # The output of all pipes is read into this one buffer, and only the
+        # incomplete last line of each pipe is kept, in "partial_lines".
+        self.read_buf = bytearray(READ_SIZE)
+        self.partial_lines = {} # fd -> bytearray
+        # epoll on Linux: no FD_SETSIZE limit, and the cost of each wakeup
+        # depends only on the number of ready file descriptors
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+
+        self.native_scheduler = ping_multi_ext.icmp.NativeScheduler()
+        self.native_permitted = self.native is not None
+
+        # (pid, [hostname, ...]) of the processes which closed their output
+        self.exited_procs = []
+
+        # The queue contains hostnames, and SshMuxStream and FpingStream objects;
+        # each stream is started in place of its first host.
+        mux_lookup = {}
+        streams = [SshMuxStream(group['cmdline'], group['hosts']) for group in self.ssh_mux]
+        if self.fping is not None and len(self.fping['hosts']):
+            streams.append(FpingStream(self.fping['options'], self.fping['hosts'], self.fping['targets']))
+        for stream in streams:
+            for hostname in stream.hostnames:
+                mux_lookup[hostname] = stream
+        self.start_queue = deque()
         for hostname in self.hosts_data:
-            data = self.hosts_data[hostname]
-            pid, pipe_r = self.start_process(data['proc']['cmdline'])
-            data['proc']['pid'] = pid
-            data['proc']['out_fd'] = pipe_r
-            self.fd_lookup[pipe_r] = hostname
-
-        self.exited_hosts = []
-        self.select_fdlist = list(self.fd_lookup.keys())
+            stream = mux_lookup.get(hostname)
+            if stream is None:
+                self.start_queue.append(hostname)
+            elif stream.hostnames[0] == hostname:
+                self.start_queue.append(stream)
+
+        # With a rate limit, the hosts are started gradually from the collector loop.
+        # This also staggers the probes of the hosts, instead of sending them in bursts.
+        self.start_queue_began = time.monotonic()
+        self.started_cnt = 0
+        self.handle_start_queue()
+
+    def start_host(self, hostname):
+        if self.start_native_pinger(hostname):
+            return
 
-    def parse_time(self, line):
-        line = line.strip()
-        if not len(line):
-            return None
+        data = self.hosts_data[hostname]
+        pid, pipe_r = self.start_process(data.cmdline)
+        data.pid = pid
+        data.out_fd = pipe_r
+        self.fd_lookup[pipe_r] = hostname
+        self.partial_lines[pipe_r] = bytearray()
+        self.selector.register(pipe_r, selectors.EVENT_READ)
+
+    def start_stream(self, stream):
+        pid, pipe_r = self.start_process(stream.cmdline)
+        stream.pid = pid
+        for hostname in stream.hostnames:
+            data = self.hosts_data[hostname]
+            data.pid = pid
+            data.out_fd = pipe_r
+        self.partial_lines[pipe_r] = bytearray()
+        self.selector.register(pipe_r, selectors.EVENT_READ, stream)
 
-        if re.search(r'^PING\s.+((bytes of data)|(data bytes))', line):
-            return None
+    def handle_start_queue(self):
+        if not len(self.start_queue):
+            return
 
-        m = re.search(r'^\d+\sbytes\sfrom\s.+\sttl=\d+\s+time=([\d\.]+)\sms$', line)
-        if not m:
-            res = '???'
+        if self.spawn_rate:
+            elapsed = time.monotonic() - self.start_queue_began
+            allowed_cnt = int(elapsed * self.spawn_rate) + 1 - self.started_cnt
         else:
-            res = m.group(1)
-            try:
-                res = float(res)
-                res = round(res)
-            except:
-                res = 'ERR' # this should never happen
+            allowed_cnt = len(self.start_queue)
 
-        return res
+        for _ in range(min(allowed_cnt, len(self.start_queue))):
+            item = self.start_queue.popleft()
+            if isinstance(item, (SshMuxStream, FpingStream)):
+                self.start_stream(item)
+            else:
+                self.start_host(item)
+            self.started_cnt += 1
 
-    def parse_seq(self, line):
-        m = re.search(r'\sicmp_seq=(\d+)(\s|$)', line)
-        if m:
-            return int(m.group(1))
-        else:
+    def time_to_next_start(self):
+        if not len(self.start_queue) or not self.spawn_rate:
             return None
 
-    def parse_timeout(self, line):
-        return re.search(r'^no answer yet for icmp_seq=\d+$', line)
+        next_start = self.start_queue_began + self.started_cnt / self.spawn_rate
+        return max(0, next_start - time.monotonic())
+
+    # returns False if the host must be pinged by an external process instead
+    def start_native_pinger(self, hostname):
+        if not self.native_permitted or hostname not in self.native['targets']:
+            return False
+
+        try:
+            pinger = ping_multi_ext.icmp.NativePinger(
+                self.native['targets'][hostname], self.native['interval']
+            )
+        except ping_multi_ext.icmp.NativePingNotPermitted:
+            # no need to try again for each host; see "net.ipv4.ping_group_range"
+            self.native_permitted = False
+            return False
+        except socket.gaierror:
+            return False # let "ping" report the resolve error as usual
+
+        self.fd_lookup[pinger.fileno()] = hostname
+        self.selector.register(pinger.fileno(), selectors.EVENT_READ, pinger)
+        self.native_scheduler.add(pinger, time.monotonic())
+        self.handle_output(hostname, pinger.header(), False)
+
+        return True
+
+    def handle_native_timers(self):
+        for pinger in self.native_scheduler.pop_due():
+            s = pinger.send()
+            if len(s):
+                self.handle_output(self.fd_lookup[pinger.fileno()], s, False)
+
+    def wakeup(self):
+        try:
+            os.write(self.wakeup_w, b'.')
+        except BlockingIOError:
+            pass # the pipe is full, so a wakeup is pending anyway
 
     def handle_pipes(self, timeout):
-        if not len(self.select_fdlist):
-            time.sleep(0.05)
-            if self.debug:
-                print('== No active processes')
-                time.sleep(1)
-            return
+        if self.debug and len(self.selector.get_map()) == 1:
+            print('== No active processes')
 
-        (fds_read_ready, _, _) = select.select(self.select_fdlist, [], [], timeout)
-        for fd in fds_read_ready:
-            s = os.read(fd, 1024 * 1024)
+        for time_to_next in (self.native_scheduler.time_to_next(), self.time_to_next_start()):
+            if time_to_next is not None:
+                timeout = min(timeout, time_to_next)
 
-            if not len(s): # EOF
-                terminated = True
-                s = '\nCommand terminated.\n'
-                self.select_fdlist.remove(fd)
-                self.exited_hosts.append(self.fd_lookup[fd])
-            else:
-                terminated = False
-                s = s.decode('ascii', 'replace')
-
-            all_s_parts = s.split('\n')
-
-            s_ends_newline = s.endswith('\n')
-            if s_ends_newline:
-                all_s_parts.pop() # remove this empty line which shows that "s" ends in "\n"
-
-            data = self.hosts_data[self.fd_lookup[fd]]
-            with data['lock']:
-                for idx, part in enumerate(all_s_parts): # all we have left here is real data
-                    if idx != len(all_s_parts) - 1: # not last element
-                        newline = True # all non-last elements ended in "\n" and were split
-                    else: # last element
-                        newline = s_ends_newline
-
-                    if not data['raw_complete']: # last line didn't end with "\n"
-                        data['raw'][-1] += part # append to the existing line
-                    else: # last line was ended with "\n"
-                        data['raw'].append(part) # start a new line
-
-                    data['raw_complete'] = newline
-
-                    if newline:
-                        if self.debug:
-                            print(data['raw'][-1])
-
-                        if not terminated:
-                            seq = self.parse_seq(data['raw'][-1])
-
-                            if seq is not None:
-                                if data['seen_rx_seq'].get(seq):
-                                    pd = self.parse_time(data['raw'][-1])
-                                    if pd:
-                                        # display the raw "time" value in the "Last" stats
-                                        # even if it was marked as a timeout already
-                                        data['stats']['Last'] = pd
-                                    continue # we have already handled this "seq"
-                                else:
-                                    data['seen_rx_seq'][seq] = True
-
-                            if seq is not None and seq > data['stats']['TX_cnt']:
-                                data['stats']['TX_cnt'] = seq
-
-                            is_timeout = self.parse_timeout(data['raw'][-1])
-
-                            if is_timeout:
-                                pd = '*'
-                            else:
-                                pd = self.parse_time(data['raw'][-1])
-
-                            data['stats']['Last'] = pd
-                            if pd is not None:
-                                data['parsed'].append(pd)
-                                if self.debug:
-                                    print(f'PARSED: "{pd}"')
-
-                            if type(pd) is int and pd < self.timeout * 1000:
-                                data['stats']['RX_cnt'] += 1
-                            data['stats']['XX_cnt'] = \
-                                data['stats']['TX_cnt'] - data['stats']['RX_cnt']
-
-                            if data['stats']['TX_cnt'] > 0:
-                                data['stats']['Loss%'] = '{:.0f}%'.format(
-                                    (1 - data['stats']['RX_cnt'] / data['stats']['TX_cnt']) * 100
-                                )
-
-                            points = list(filter(lambda x: type(x) is int, data['parsed']))
-                            if len(points):
-                                data['stats']['StDev'] = '{:.1f}'.format(statistics.pstdev(points))
-                                data['stats']['Max'] = max(points)
-                                data['stats']['Min'] = min(points)
-                                data['stats']['Avg'] = round(sum(points) / len(points))
+        ready = self.selector.select(timeout)
+        t_start = time.perf_counter()
 
-    def handle_exited_hosts(self):
-        done_hostnames = []
-        for hostname in self.exited_hosts:
-            data = self.hosts_data[hostname]
-            
-            einfo = os.waitid(os.P_PID, data['proc']['pid'], os.WEXITED | os.WNOHANG)
-            if einfo is None: # child not completely exited, yet
+        for key, _ in ready:
+            fd = key.fd
+            if fd == self.wakeup_r:
+                os.read(fd, 4096)
+                continue
+
+            if isinstance(key.data, (SshMuxStream, FpingStream)):
+                self.handle_stream(key.data, fd)
+                continue
+
+            hostname = self.fd_lookup[fd]
+
+            if key.data is not None: # native pinger
+                s = key.data.receive()
+                if len(s):
+                    self.handle_output(hostname, s, False)
+                continue
+
+            n = os.readv(fd, [self.read_buf])
+            partial = self.partial_lines[fd]
+
+            if not n: # EOF
+                self.selector.unregister(fd)
+                os.close(fd)
+                del self.fd_lookup[fd]
+                del self.partial_lines[fd]
+                self.exited_procs.append((self.hosts_data[hostname].pid, [hostname]))
+
+                if len(partial): # show all of it; the message below completes it
+                    self.handle_lines(hostname, [], partial, None)
+                self.handle_output(hostname, '\nCommand terminated.\n', True)
+                continue
+
+            self.prof_bytes.add(n)
+            self.handle_lines(hostname, split_lines(self.read_buf, n, partial), partial)
+
+        self.handle_native_timers()
+
+        self.prof_loop.add(time.perf_counter() - t_start)
+
+    # the number of bytes which wait to be read from all pipes
+    def pipe_backlog(self):
+        backlog = 0
+        for key in list(self.selector.get_map().values()):
+            if key.fd == self.wakeup_r or isinstance(key.data, ping_multi_ext.icmp.NativePinger):
                 continue
+            backlog += readable_bytes(key.fd)
+        return backlog
 
-            done_hostnames.append(hostname)
+    def handle_profiler(self):
+        if self.profiler is None or not self.profiler.is_due():
+            return
+
+        self.profiler.sample({'pipe backlog bytes': self.pipe_backlog()})
+        if self.profiler.overlay:
+            self.updated = True # so that the UI shows the new results
+
+    def handle_stream(self, stream, fd):
+        n = os.readv(fd, [self.read_buf])
+
+        if not n: # EOF; the whole SSH session or "fping" is gone
+            self.selector.unregister(fd)
+            os.close(fd)
+            partial = self.partial_lines.pop(fd)
+            if len(partial): # e.g. the last error of "ssh"; see handle_pipes()
+                self.handle_stream_lines(stream, [bytes(partial)], True)
+            hostnames = [hostname for hostname in stream.hostnames if hostname in stream.running]
+            for hostname in hostnames:
+                self.handle_output(hostname, '\nCommand terminated.\n', True)
+            self.exited_procs.append((stream.pid, hostnames))
+            return
 
-            if einfo.si_code == os.CLD_EXITED:
-                term_reason = f'exited with status {einfo.si_status}'
+        self.prof_bytes.add(n)
+        self.handle_stream_lines(stream, split_lines(self.read_buf, n, self.partial_lines[fd]))
+
+    # "last" is set for the incomplete line at EOF, which is shown as a whole
+    # and then completed by "Command terminated."
+    def handle_stream_lines(self, stream, lines, last=False):
+        for (hostname, line, exit_status) in stream.feed(lines):
+            if exit_status is not None: # only this "ping" exited; the SSH session is still running
+                self.handle_output(hostname, '\nCommand terminated.\n', True)
+                self.finish_host(hostname, f'exited with status {exit_status}')
+            elif last:
+                self.handle_lines(hostname, [], line, None)
             else:
-                term_reason = f'killed by signal {einfo.si_status}' # (si_code={einfo.si_code})
+                self.handle_lines(hostname, [line])
+
+    # Adds the complete "lines" (bytes, without "\n") of the output of a host,
+    # and then shows the incomplete line "partial" as the last raw line, up
+    # to "shown_max" bytes. Each line is decoded only once, when it's added.
+    def handle_lines(self, hostname, lines, partial=b'', shown_max=PARTIAL_LINE_SHOWN_MAX):
+        self.prof_lines.add(len(lines))
+
+        data = self.hosts_data[hostname]
+        with data.lock:
+            data.generation += 1
+            self.updated = True
+
+            for line in lines:
+                text = line.decode('ascii', 'replace')
+                if data.raw_complete:
+                    data.raw.append(text)
+                else: # it replaces the incomplete line, which was shown until now
+                    data.raw[-1] = text
+                    data.raw_complete = True
 
-            with data['lock']:
-                data['proc']['pid'] = None
-                data['raw'].append(f'== Process {term_reason}')
-                data['parsed'].append('EXIT')
                 if self.debug:
-                    print(data['raw'][-1])
+                    print(text)
+                self.handle_line(hostname, data, line, text)
+
+            if len(partial):
+                text = partial[:shown_max].decode('ascii', 'replace')
+                if data.raw_complete:
+                    data.raw.append(text)
+                    data.raw_complete = False
+                else:
+                    data.raw[-1] = text
+
+    # The same for the output "s" as a string, as produced by the native
+    # pinger and the replay. If "terminated", the lines are not parsed.
+    def handle_output(self, hostname, s, terminated):
+        self.prof_bytes.add(len(s))
+        self.prof_lines.add(s.count('\n'))
+
+        all_s_parts = s.split('\n')
+
+        s_ends_newline = s.endswith('\n')
+        if s_ends_newline:
+            all_s_parts.pop() # remove this empty line which shows that "s" ends in "\n"
+
+        data = self.hosts_data[hostname]
+        with data.lock:
+            data.generation += 1
+            self.updated = True
+
+            for idx, part in enumerate(all_s_parts): # all we have left here is real data
+                if idx != len(all_s_parts) - 1: # not last element
+                    newline = True # all non-last elements ended in "\n" and were split
+                else: # last element
+                    newline = s_ends_newline
+
+                if not data.raw_complete: # last line didn't end with "\n"
+                    data.raw[-1] += part # append to the existing line
+                else: # last line was ended with "\n"
+                    data.raw.append(part) # start a new line
+
+                data.raw_complete = newline
+
+                if newline:
+                    if self.debug:
+                        print(data.raw[-1])
+
+                    if not terminated:
+                        text = data.raw[-1]
+                        self.handle_line(hostname, data, text.encode('ascii', 'replace'), text)
+
+    # Parses one complete output line, "line" as bytes and "text" as it's
+    # shown, and updates the statistics of the host. The lock is held.
+    def handle_line(self, hostname, data, line, text):
+        if self.raw_listeners:
+            ts = self.wall_clock()
+            for listener in self.raw_listeners:
+                listener(hostname, text, ts)
+
+        (kind, seq, _, rtt) = self.parser.parse(line)
+
+        if kind == parser.LINE_TIMEOUT:
+            pd = ping_multi_ext.host.PD_TIMEOUT
+        elif kind == parser.LINE_REPLY or kind == parser.LINE_DUPLICATE:
+            pd = rtt if type(rtt) is int else ping_multi_ext.host.PD_RTT_ERR
+        elif kind == parser.LINE_ERROR:
+            pd = ping_multi_ext.host.PD_ERROR
+        else: # empty line or header
+            pd = None
+
+        # errors without a sequence number are not probe results
+        is_sample = pd is not None and (kind != parser.LINE_ERROR or seq is not None)
+        if is_sample and self.sample_listeners:
+            self.notify_sample(hostname, kind, seq, rtt)
+
+        if seq is not None:
+            is_reply = kind == parser.LINE_REPLY or kind == parser.LINE_DUPLICATE
+            (seq, seq_status) = data.seq_window.add(seq, is_reply)
+
+            if seq_status == ping_multi_ext.stats.SEQ_OUT_OF_ORDER:
+                if is_reply:
+                    data.ooo_cnt += 1
+            elif seq_status != ping_multi_ext.stats.SEQ_NEW:
+                if seq_status == ping_multi_ext.stats.SEQ_DUPLICATE:
+                    data.dup_cnt += 1
+                elif seq_status == ping_multi_ext.stats.SEQ_LATE:
+                    data.late_cnt += 1
+                    if pd >= 0: # the real RTT still counts in the statistics
+                        data.add_rtt(pd)
+                if pd is not None and kind != parser.LINE_TIMEOUT:
+                    # display the raw "time" value in the "Last" stats
+                    # even if it was marked as a timeout already
+                    data.last = pd
+                return # we have already handled this "seq"
+
+        if seq is not None and seq > data.tx_cnt:
+            data.tx_cnt = seq
+
+        data.last = pd
+        if pd is not None:
+            data.parsed.append(pd)
+            if self.debug:
+                print(f'PARSED: "{ping_multi_ext.host.decode_pd(pd)}"')
+
+            if pd >= 0: # an RTT
+                data.add_rtt(pd)
+                if pd < self.timeout * 1000:
+                    data.rx_cnt += 1
+
+    def finish_host(self, hostname, term_reason):
+        data = self.hosts_data[hostname]
+        with data.lock:
+            data.generation += 1
+            self.updated = True
+            data.pid = None
+            data.raw.append(f'== Process {term_reason}')
+            data.parsed.append(ping_multi_ext.host.PD_EXIT)
+            if self.debug:
+                print(data.raw[-1])
 
-        for hostname in done_hostnames:
-            self.exited_hosts.remove(hostname)
+    def handle_exited_hosts(self):
+        done_procs = []
+        for (pid, hostnames) in self.exited_procs:
+            if pid is None: # see start_failed()
+                term_reason = 'failed to start'
+            else:
+                einfo = os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG)
+                if einfo is None: # child not completely exited, yet
+                    continue
 
+                if einfo.si_code == os.CLD_EXITED:
+                    term_reason = f'exited with status {einfo.si_status}'
+                else:
+                    term_reason = f'killed by signal {einfo.si_status}' # (si_code={einfo.si_code})
+
+            done_procs.append((pid, hostnames))
+
+            for hostname in hostnames:
+                self.finish_host(hostname, term_reason)
+
+        for item in done_procs:
+            self.exited_procs.remove(item)
+
+    # the hosts run until we kill them; see ReplayWorkflow
+    def is_finished(self):
+        return False
+
+    # Wait up to "timeout" seconds for new data; returns True if any host data was updated.
     def update_hosts_data(self, timeout):
+        self.updated = False
+
+        if len(self.exited_procs):
+            timeout = min(timeout, 0.05) # poll until the exited children are reaped
+
         self.handle_pipes(timeout)
         self.handle_exited_hosts()
+        self.handle_start_queue()
+        self.handle_profiler()
+
+        return self.updated
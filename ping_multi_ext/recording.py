@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import struct
+import select
+import ping_multi_ext
+import ping_multi_ext.proc
+import ping_multi_ext.parser as parser
+
+# A recording is a header followed by fixed-size records:
+#
+#   - 8 bytes magic, 4 bytes little-endian length of the JSON header, the
+#     JSON header itself, zero padding up to a multiple of RECORD_SIZE
+#   - records of RECORD_SIZE bytes: timestamp (double), host index (uint32),
+#     kind (uint8), flags (uint8) and an 18-byte payload
+#
+# The JSON header contains the list of hosts, and records refer to a host
+# by its index in that list. All records have the same size and alignment,
+# so a recording can be mmap()'ed and indexed directly, and a truncated
+# file (e.g. after a crash) loses only its last incomplete record.
+#
+# The payload of a probe record is "seq" and "rtt" (int32 each, see
+# _encode_int). The raw output lines are optional. A line is split into
+# pieces of up to 18 bytes: one KIND_RAW_LINE record followed by as many
+# KIND_RAW_CONT records as needed, where "flags" is the length of the piece.
+
+MAGIC = b'PMXREC1\n'
+RECORD_SIZE = 32
+
+_header_len_fmt = struct.Struct('<I')
+_record_fmt = struct.Struct('<dIBB18s')
+_probe_fmt = struct.Struct('<ii')
+_raw_piece_len = 18
+
+KIND_RAW_LINE = 16
+KIND_RAW_CONT = 17
+
+_kind_codes = {
+    parser.LINE_REPLY: 1,
+    parser.LINE_TIMEOUT: 2,
+    parser.LINE_DUPLICATE: 3,
+    parser.LINE_ERROR: 4,
+}
+_kind_names = {code: kind for (kind, code) in _kind_codes.items()}
+
+FLAG_TIMEOUT = 1
+
+# "seq" and "rtt" may also be None, and "rtt" may be "ERR"
+_INT_NONE = -1
+_INT_ERR = -2
+
+class RecordingFormatError(Exception):
+    pass
+
+def _encode_int(value):
+    if value is None:
+        return _INT_NONE
+    if value == 'ERR':
+        return _INT_ERR
+    return value
+
+def _decode_int(value):
+    if value == _INT_NONE:
+        return None
+    if value == _INT_ERR:
+        return 'ERR'
+    return value
+
+class Recorder:
+    def __init__(self, path, hosts, timeout, record_raw, flush_interval=1):
+        self.record_raw = record_raw
+        self.flush_interval = flush_interval
+        self.host_idx = {hostname: idx for (idx, hostname) in enumerate(hosts)}
+
+        header = json.dumps({
+            'version': ping_multi_ext.version,
+            'hosts': hosts,
+            'timeout': timeout,
+            'raw': record_raw,
+        }).encode('utf-8')
+        header = MAGIC + _header_len_fmt.pack(len(header)) + header
+        header += bytes(-len(header) % RECORD_SIZE)
+
+        self.f = open(path, 'wb', buffering=1024 * 1024)
+        self.f.write(header)
+        self.last_flush = time.monotonic()
+
+    # a sample listener of the Workflow
+    def add_sample(self, hostname, kind, seq, rtt, is_timeout, ts):
+        self.f.write(_record_fmt.pack(
+            ts, self.host_idx[hostname], _kind_codes[kind], FLAG_TIMEOUT if is_timeout else 0,
+            _probe_fmt.pack(_encode_int(seq), _encode_int(rtt))
+        ))
+        self.flush_if_due()
+
+    # a raw line listener of the Workflow
+    def add_raw_line(self, hostname, line, ts):
+        host_idx = self.host_idx[hostname]
+        data = line.encode('utf-8')
+
+        kind = KIND_RAW_LINE
+        pos = 0
+        while True: # an empty line still takes one record
+            piece = data[pos:pos + _raw_piece_len]
+            self.f.write(_record_fmt.pack(ts, host_idx, kind, len(piece), piece))
+            kind = KIND_RAW_CONT
+            pos += _raw_piece_len
+            if pos >= len(data):
+                break
+
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.f.flush()
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        self.f.close()
+
+def read_header(f):
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise RecordingFormatError('not a ping-multi recording')
+
+    try:
+        (header_len,) = _header_len_fmt.unpack(f.read(_header_len_fmt.size))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    except (struct.error, ValueError):
+        raise RecordingFormatError('corrupted header')
+
+    pos = len(MAGIC) + _header_len_fmt.size + header_len
+    f.seek(pos + (-pos % RECORD_SIZE))
+
+    return header
+
+def load_header(path):
+    with open(path, 'rb') as f:
+        return read_header(f)
+
+# Yields (ts, hostname, kind, seq, rtt, is_timeout) for probe records and
+# (ts, hostname, None, line, None, None) for the raw lines.
+def iter_records(f, hosts, chunk_records=4096):
+    raw_line = None # (ts, hostname, bytes) which may continue in the next record
+
+    while True:
+        chunk = f.read(RECORD_SIZE * chunk_records)
+        chunk = chunk[:len(chunk) - len(chunk) % RECORD_SIZE] # an incomplete last record
+
+        for (ts, host_idx, kind, flags, payload) in _record_fmt.iter_unpack(chunk):
+            if kind == KIND_RAW_CONT:
+                if raw_line is not None:
+                    raw_line[2].extend(payload[:flags])
+                continue
+
+            if raw_line is not None:
+                yield (raw_line[0], raw_line[1], None, raw_line[2].decode('utf-8', 'replace'), None, None)
+                raw_line = None
+
+            if host_idx >= len(hosts):
+                raise RecordingFormatError(f'invalid host index {host_idx}')
+            hostname = hosts[host_idx]
+
+            if kind == KIND_RAW_LINE:
+                raw_line = (ts, hostname, bytearray(payload[:flags]))
+            elif kind in _kind_names:
+                (seq, rtt) = _probe_fmt.unpack_from(payload)
+                yield (ts, hostname, _kind_names[kind], _decode_int(seq), _decode_int(rtt), bool(flags & FLAG_TIMEOUT))
+
+        if len(chunk) < RECORD_SIZE * chunk_records:
+            break
+
+    if raw_line is not None:
+        yield (raw_line[0], raw_line[1], None, raw_line[2].decode('utf-8', 'replace'), None, None)
+
+# Format a probe record as the line which "ping -O" would have printed,
+# so that it goes through the usual parsing and statistics.
+def format_probe_line(hostname, kind, seq, rtt):
+    if kind == parser.LINE_TIMEOUT:
+        return f'no answer yet for icmp_seq={seq}'
+
+    seq_str = f' icmp_seq={seq}' if seq is not None else ''
+
+    if kind == parser.LINE_ERROR or type(rtt) is not int:
+        return f'From {hostname}{seq_str} (recorded error)'
+
+    line = f'64 bytes from {hostname}:{seq_str} ttl=0 time={rtt} ms'
+    if kind == parser.LINE_DUPLICATE:
+        line += ' (DUP!)'
+    return line
+
+# Feeds a recording to "hosts_data" instead of running any "ping" command.
+# The events are replayed with their original timing, sped up "speed" times.
+# If the raw lines were recorded, they are replayed as they are, otherwise
+# the probe records are formatted back into "ping" output lines.
+class ReplayWorkflow(ping_multi_ext.proc.Workflow):
+    def __init__(self, hosts_data, timeout, path, speed=1):
+        super().__init__(hosts_data, timeout)
+        self.path = path
+        self.speed = speed
+        self.wall_clock = self.replay_clock
+
+    def replay_clock(self):
+        return self.event_ts
+
+    def start_all_processes(self):
+        self.f = open(self.path, 'rb', buffering=1024 * 1024)
+        header = read_header(self.f)
+        self.use_raw = header['raw']
+        self.records = iter_records(self.f, header['hosts'])
+
+        self.replay_began = time.monotonic()
+        self.first_ts = None
+        self.event_ts = None
+        self.next_event = self.read_next_event()
+
+    def read_next_event(self):
+        for event in self.records:
+            is_raw = event[2] is None
+            if is_raw == self.use_raw:
+                if self.first_ts is None:
+                    self.first_ts = event[0]
+                return event
+
+        self.f.close()
+        for hostname in self.hosts_data:
+            self.finish_host(hostname, 'replay finished')
+        return None
+
+    def pipe_backlog(self):
+        return 0 # no pipes
+
+    def is_finished(self):
+        return self.next_event is None
+
+    def time_to_next_event(self):
+        due_at = self.replay_began + (self.next_event[0] - self.first_ts) / self.speed
+        return due_at - time.monotonic()
+
+    def update_hosts_data(self, timeout, max_events=10000):
+        self.updated = False
+
+        if self.next_event is not None:
+            timeout = min(timeout, max(0, self.time_to_next_event()))
+
+        # sleep, unless woken up by another thread
+        (readable, _, _) = select.select([self.wakeup_r], [], [], timeout)
+        if readable:
+            os.read(self.wakeup_r, 4096)
+
+        # don't block the other threads for too long if we are far behind
+        for _ in range(max_events):
+            if self.next_event is None or self.time_to_next_event() > 0:
+                break
+
+            (ts, hostname, kind, seq, rtt, _) = self.next_event
+            self.event_ts = ts
+            if kind is None:
+                line = seq
+            else:
+                line = format_probe_line(hostname, kind, seq, rtt)
+            self.handle_output(hostname, line + '\n', False)
+
+            self.next_event = self.read_next_event()
+
+        self.handle_profiler()
+
+        return self.updated
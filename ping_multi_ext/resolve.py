@@ -0,0 +1,50 @@
+import socket
+import ipaddress
+import concurrent.futures
+
+# Resolves the hostnames before any "ping" is started, so that the lookups
+# run concurrently instead of one after another inside each "ping".
+
+MAX_WORKERS = 32
+
+# The default lookup function: the first address of "name".
+# Raises OSError (socket.gaierror) if the name cannot be resolved.
+def lookup_address(name):
+    return socket.getaddrinfo(name, None, 0, socket.SOCK_DGRAM)[0][4][0]
+
+def is_ip_address(name):
+    try:
+        ipaddress.ip_address(name)
+    except ValueError:
+        return False
+    return True
+
+def _lookup(lookup, name):
+    try:
+        return (lookup(name), None)
+    except OSError as ex:
+        return (None, str(ex))
+
+# Returns {name: (address or None, error message or None)}. Each name is
+# looked up only once, however many times it's given.
+#
+# "lookup" is a function with the interface of lookup_address(). It can be
+# replaced to resolve without a DNS server, for example in the benchmarks.
+def resolve_all(names, lookup=lookup_address, max_workers=MAX_WORKERS):
+    results = {}
+    pending = []
+
+    for name in dict.fromkeys(names): # unique, in the original order
+        if is_ip_address(name):
+            results[name] = (name, None)
+        else:
+            pending.append(name)
+
+    if not len(pending):
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as pool:
+        for name, result in zip(pending, pool.map(lambda name: _lookup(lookup, name), pending)):
+            results[name] = result
+
+    return results
@@ -0,0 +1,126 @@
+import re
+import bisect
+import threading
+import ping_multi_ext.history
+
+class SearchPatternError(Exception):
+    pass
+
+# Incremental search index of the raw output of one host.
+#
+# update() runs in a background thread. Each call matches only the lines
+# which arrived since the previous one, and records the absolute position
+# (see RingBuffer.total()) of every match. So jumping to the next match is a
+# binary search, however long the history is. The newest line may still be
+# extended by the collector, so it's matched on demand instead.
+class RawSearchIndex:
+    def __init__(self, history, pattern):
+        try:
+            self.regex = re.compile(pattern)
+        except re.error as ex:
+            raise SearchPatternError(f'Invalid search pattern "{pattern}": {ex}') from None
+
+        self.history = history
+        self.pattern = pattern
+        self.matches = [] # sorted; replaced, never changed in place, when trimmed
+        self.scanned = 0 # the absolute position of the next line to match
+        self.caught_up = False # the history which existed at the start is indexed
+        self.stopped = False
+        self.wakeup_event = threading.Event()
+        self.wakeup_event.set() # index the existing history right away
+
+    def wakeup(self):
+        self.wakeup_event.set()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup_event.set()
+
+    # Waits up to "timeout" seconds for wakeup(), then indexes the new lines.
+    # Returns True if it made any progress.
+    def update(self, timeout):
+        self.wakeup_event.wait(timeout)
+        self.wakeup_event.clear()
+
+        snap = self.history.snapshot()
+        start = max(self.scanned, snap.dropped)
+        end = snap.total() - 1 # skip the newest line
+
+        if start >= end:
+            self.caught_up = True
+            return False
+
+        matches = self.matches
+        if len(matches) and matches[0] < snap.dropped and \
+                bisect.bisect_left(matches, snap.dropped) > len(matches) / 2:
+            # forget the matches which are no longer in the history
+            matches = matches[bisect.bisect_left(matches, snap.dropped):]
+            self.matches = matches
+
+        try:
+            for pos in range(start, end):
+                if self.stopped:
+                    break
+                if self.regex.search(snap[pos - snap.dropped]):
+                    matches.append(pos)
+                self.scanned = pos + 1
+            else:
+                self.caught_up = True
+        except ping_multi_ext.history.StaleReadError:
+            pass # the rest was dropped meanwhile; continue from there with the next call
+
+        return True
+
+    def is_complete(self, snap):
+        return self.scanned >= snap.total() - 1
+
+    # The indexes in "matches" of the first and past the last match in the
+    # snapshot "snap", not counting its newest line, and whether that matches.
+    def _range(self, snap, matches):
+        lo = bisect.bisect_left(matches, snap.dropped)
+        hi = bisect.bisect_left(matches, snap.total() - 1, lo)
+
+        try:
+            newest_matches = len(snap) > 0 and self.regex.search(snap[-1]) is not None
+        except ping_multi_ext.history.StaleReadError:
+            newest_matches = False
+
+        return (lo, hi, newest_matches)
+
+    def count(self, snap):
+        (lo, hi, newest_matches) = self._range(snap, self.matches)
+        return hi - lo + newest_matches
+
+    # The absolute position of the nearest match after (or before) "pos",
+    # or None, and whether that's final or a nearer match may still be indexed.
+    def find(self, snap, pos, forward):
+        scanned = self.scanned
+        if forward:
+            found = self._next_match(snap, pos)
+            final = (found is not None and found < scanned) or self.is_complete(snap)
+        else:
+            found = self._prev_match(snap, pos)
+            final = pos <= scanned or self.is_complete(snap)
+        return (found, final)
+
+    def _next_match(self, snap, pos):
+        matches = self.matches
+        (lo, hi, newest_matches) = self._range(snap, matches)
+
+        idx = bisect.bisect_right(matches, pos, lo, hi)
+        if idx < hi:
+            return matches[idx]
+        if newest_matches and pos < snap.total() - 1:
+            return snap.total() - 1
+        return None
+
+    def _prev_match(self, snap, pos):
+        matches = self.matches
+        (lo, hi, newest_matches) = self._range(snap, matches)
+
+        if newest_matches and pos > snap.total() - 1:
+            return snap.total() - 1
+        idx = bisect.bisect_left(matches, pos, lo, hi)
+        if idx > lo:
+            return matches[idx - 1]
+        return None
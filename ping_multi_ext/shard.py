@@ -0,0 +1,255 @@
+import os
+import time
+import signal
+import threading
+import multiprocessing
+import multiprocessing.connection
+import ping_multi_ext.proc
+import ping_multi_ext.history
+import ping_multi_ext.host
+
+# Spreads the hosts over worker processes, each running its own Workflow,
+# so that reading, decoding and parsing the output of thousands of hosts
+# is not limited to the one CPU core of the collector thread.
+#
+# A worker keeps only what it has not sent yet. Every FLUSH_INTERVAL
+# seconds, it sends a list of deltas through a pipe, one per changed host:
+# the new raw lines (the first one replaces the last one sent, which may
+# have been incomplete), the new parsed values, the new RTT samples for the
+# statistics, the current counters, and the events for the listeners.
+# The main process merges them into "hosts_data", so the UI, the metrics
+# exporter and the recorder work as with a single Workflow.
+
+FLUSH_INTERVAL = 0.05
+
+# Stands in for LogHistogram in a worker: the samples are only collected,
+# and the main process adds them to the real histogram.
+class _SampleLog:
+    def __init__(self):
+        self.samples = []
+
+    def add(self, value):
+        self.samples.append(value)
+
+def _new_worker_host_data(cmdline):
+    raw = ping_multi_ext.history.RingBuffer()
+    raw.append('')
+
+    return ping_multi_ext.host.HostState(
+        cmdline, ping_multi_ext.history.RingBuffer(typecode='i'), raw,
+        lock=threading.Lock(), rtt_hist=_SampleLog()
+    )
+
+def _collect_deltas(hosts_data, sent_generation, events):
+    deltas = []
+    for hostname, data in hosts_data.items():
+        if data.generation == sent_generation[hostname]:
+            continue
+        sent_generation[hostname] = data.generation
+
+        raw = data.raw
+        deltas.append((
+            hostname, list(raw), list(data.parsed), data.rtt_hist.samples,
+            (data.tx_cnt, data.rx_cnt, data.dup_cnt, data.ooo_cnt, data.late_cnt, data.last),
+            events.pop(hostname, None),
+        ))
+
+        # keep the last line, as the output may continue it
+        data.raw = ping_multi_ext.history.RingBuffer()
+        data.raw.append(raw[-1])
+        data.parsed = ping_multi_ext.history.RingBuffer(typecode='i')
+        data.rtt_hist = _SampleLog()
+
+    return deltas
+
+def _worker_main(conn, hosts, options):
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the main process stops us; see stop_workers()
+
+    hosts_data = {hostname: _new_worker_host_data(cmdline) for (hostname, cmdline) in hosts}
+    workflow = ping_multi_ext.proc.Workflow(
+        hosts_data, options['timeout'], options['native'], options['spawn_rate'], options['ssh_mux'],
+        options['fping'], options['parser_name']
+    )
+
+    events = {} # hostname -> ([(kind, seq, rtt, is_timeout, ts), ...], [(line, ts), ...])
+    if options['samples']:
+        workflow.add_sample_listener(
+            lambda hostname, *sample: events.setdefault(hostname, ([], []))[0].append(sample)
+        )
+    if options['raw']:
+        workflow.add_raw_listener(
+            lambda hostname, *line: events.setdefault(hostname, ([], []))[1].append(line)
+        )
+
+    stop_run = False
+    def stop_handler(a, b):
+        nonlocal stop_run
+        stop_run = True
+        workflow.wakeup()
+
+    signal.signal(signal.SIGTERM, stop_handler)
+
+    sent_generation = {hostname: 0 for hostname in hosts_data}
+    workflow.start_all_processes()
+    next_flush = time.monotonic()
+
+    try:
+        while not stop_run:
+            workflow.update_hosts_data(max(0, next_flush - time.monotonic()))
+
+            if time.monotonic() >= next_flush:
+                deltas = _collect_deltas(hosts_data, sent_generation, events)
+                if len(deltas):
+                    conn.send(deltas)
+                next_flush = time.monotonic() + FLUSH_INTERVAL
+    except BrokenPipeError: # the main process is gone
+        pass
+    finally:
+        for data in hosts_data.values():
+            if not data.pid:
+                continue
+            try:
+                os.kill(data.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+# Splits the hosts into at most "workers_cnt" shards with a similar number
+# of hosts. The hosts of an SSH multiplexing group stay in the same shard.
+# The "fping" hosts are split too, and each shard runs its own "fping".
+def shard_hosts(hostnames, ssh_mux, workers_cnt, fping=None):
+    mux_lookup = {}
+    for group in ssh_mux or []:
+        for hostname in group['hosts']:
+            mux_lookup[hostname] = group
+
+    units = [] # ([hostname, ...], ssh_mux group or None)
+    for hostname in hostnames:
+        group = mux_lookup.get(hostname)
+        if group is None:
+            units.append(([hostname], None))
+        elif group['hosts'][0] == hostname:
+            units.append((group['hosts'], group))
+
+    fping_targets = {}
+    if fping is not None:
+        fping_targets = dict(zip(fping['hosts'], fping['targets']))
+
+    shards = [{'hosts': [], 'ssh_mux': [], 'fping': None} for _ in range(min(workers_cnt, len(units)))]
+    for (unit_hosts, group) in units:
+        shard = min(shards, key=lambda shard: len(shard['hosts']))
+        shard['hosts'].extend(unit_hosts)
+        if group is not None:
+            shard['ssh_mux'].append(group)
+        elif unit_hosts[0] in fping_targets:
+            if shard['fping'] is None:
+                shard['fping'] = {'options': fping['options'], 'hosts': [], 'targets': []}
+            shard['fping']['hosts'].append(unit_hosts[0])
+            shard['fping']['targets'].append(fping_targets[unit_hosts[0]])
+
+    return shards
+
+class ShardedWorkflow(ping_multi_ext.proc.Workflow):
+    def __init__(self, hosts_data, timeout, native=None, spawn_rate=None, ssh_mux=None, workers=2,
+            fping=None, parser_name='ping'):
+        super().__init__(hosts_data, timeout, native, spawn_rate, ssh_mux, fping, parser_name)
+        self.workers_cnt = workers
+        self.workers = [] # (process, connection, [hostname, ...])
+
+    def start_all_processes(self):
+        ctx = multiprocessing.get_context('spawn') # fork() is not safe with our threads
+
+        shards = shard_hosts(list(self.hosts_data), self.ssh_mux, self.workers_cnt, self.fping)
+        for shard in shards:
+            options = {
+                'timeout': self.timeout,
+                'native': self.native,
+                # the rate limit is for all hosts together
+                'spawn_rate': self.spawn_rate / len(shards) if self.spawn_rate else self.spawn_rate,
+                'ssh_mux': shard['ssh_mux'],
+                'fping': shard['fping'],
+                'parser_name': self.parser_name,
+                'samples': len(self.sample_listeners) > 0,
+                'raw': len(self.raw_listeners) > 0,
+            }
+            hosts = [(hostname, self.hosts_data[hostname].cmdline) for hostname in shard['hosts']]
+
+            (conn_r, conn_w) = ctx.Pipe(duplex=False)
+            proc = ctx.Process(
+                name='ping-multi worker', target=_worker_main, args=(conn_w, hosts, options),
+                daemon=True
+            )
+            proc.start()
+            conn_w.close() # only the worker writes
+            self.workers.append((proc, conn_r, shard['hosts']))
+
+    def stop_workers(self):
+        for (proc, _, _) in self.workers:
+            if proc.is_alive():
+                proc.terminate() # SIGTERM; the worker stops its "ping" commands
+        for (proc, _, _) in self.workers:
+            proc.join(5)
+
+    def pipe_backlog(self):
+        return sum(ping_multi_ext.proc.readable_bytes(conn.fileno()) for (_, conn, _) in self.workers)
+
+    def apply_delta(self, delta):
+        (hostname, raw, parsed, rtts, counters, events) = delta
+        self.prof_lines.add(len(raw) - 1)
+
+        data = self.hosts_data[hostname]
+        with data.lock:
+            data.generation += 1
+            self.updated = True
+
+            data.raw[-1] = raw[0]
+            for line in raw[1:]:
+                data.raw.append(line)
+            for pd in parsed:
+                data.parsed.append(pd)
+            for rtt in rtts:
+                data.add_rtt(rtt)
+            (data.tx_cnt, data.rx_cnt, data.dup_cnt, data.ooo_cnt, data.late_cnt, data.last) = counters
+
+            if events is not None:
+                (samples, lines) = events
+                for sample in samples:
+                    for listener in self.sample_listeners:
+                        listener(hostname, *sample)
+                for line in lines:
+                    for listener in self.raw_listeners:
+                        listener(hostname, *line)
+
+    def handle_worker_exit(self, worker):
+        (proc, conn, hostnames) = worker
+        self.workers.remove(worker)
+        conn.close()
+        proc.join(5)
+
+        for hostname in hostnames:
+            self.finish_host(hostname, f'handled by a worker which exited with status {proc.exitcode}')
+
+    def update_hosts_data(self, timeout):
+        self.updated = False
+
+        conn_lookup = {worker[1]: worker for worker in self.workers}
+        ready = multiprocessing.connection.wait(list(conn_lookup) + [self.wakeup_r], timeout)
+        t_start = time.perf_counter()
+
+        for conn in ready:
+            if conn == self.wakeup_r:
+                os.read(self.wakeup_r, 4096)
+                continue
+
+            try:
+                deltas = conn.recv()
+            except EOFError:
+                self.handle_worker_exit(conn_lookup[conn])
+                continue
+
+            for delta in deltas:
+                self.apply_delta(delta)
+
+        self.prof_loop.add(time.perf_counter() - t_start)
+        self.handle_profiler()
+
+        return self.updated
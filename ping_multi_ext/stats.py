@@ -0,0 +1,207 @@
+import math
+
+# Running aggregates over the integer RTT samples of one host.
+#
+# Every update is O(1), no matter how long the history is. The RTT values
+# are integers, so we keep an exact integer sum and sum of squares. This is
+# the same single-pass idea as Welford's method but without any floating
+# point drift, which makes the results identical to what the "statistics"
+# module computes over the full list of samples.
+class RunningStats:
+    __slots__ = ('count', 'sum', 'sum_sq', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0
+        self.sum_sq = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.sum_sq += value * value
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def pvariance(self):
+        if not self.count:
+            return None
+        # exact "n * sum(x^2) - sum(x)^2" on integers, then a single division
+        return (self.count * self.sum_sq - self.sum * self.sum) / (self.count * self.count)
+
+    def pstdev(self):
+        if not self.count:
+            return None
+        return math.sqrt(self.pvariance())
+
+# Fixed-resolution histogram of the integer RTT samples, for percentiles.
+#
+# Values below 2 ** (sub_bits + 1) get a bucket each, so they are exact.
+# Above that, every power of two is split into 2 ** sub_bits buckets, so the
+# relative error of a percentile is below 1 / 2 ** (sub_bits + 1), about 3%
+# with the default. Only the buckets in use are stored, which bounds the
+# memory to a few hundred counters per host, however long the run is.
+#
+# A percentile is the midpoint of its bucket, clamped to the smallest and
+# the largest value added, so that it never contradicts "Min" and "Max".
+#
+# add() is O(1). percentile() walks the buckets in use and is cached until
+# the next add(), so it's only computed when somebody looks at it.
+#
+# percentile() can run in another thread than add() without a lock. Its
+# caches are tagged with the sample and bucket count they were computed
+# for, so a result which raced with add() is never reused.
+class LogHistogram:
+    __slots__ = ('sub_bits', 'exact_max', 'counts', 'count', 'min', 'max', '_sorted_idx', '_cache')
+
+    def __init__(self, sub_bits=4):
+        self.sub_bits = sub_bits
+        self.exact_max = 1 << (sub_bits + 1)
+        self.counts = {} # bucket index -> count; buckets are never removed
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._sorted_idx = (0, []) # (buckets count, sorted bucket indexes)
+        self._cache = (0, {}) # (samples count, pct -> value)
+
+    def _bucket_index(self, value):
+        if value < self.exact_max:
+            return value
+        shift = value.bit_length() - self.sub_bits - 1
+        return (shift << self.sub_bits) + (value >> shift)
+
+    # the midpoint of the range of values in a bucket
+    def _bucket_value(self, idx):
+        if idx < self.exact_max:
+            return idx
+        shift = (idx >> self.sub_bits) - 1
+        low = (idx - (shift << self.sub_bits)) << shift
+        return low + ((1 << shift) - 1) // 2
+
+    def add(self, value):
+        idx = self._bucket_index(value)
+        if idx in self.counts:
+            self.counts[idx] += 1
+        else:
+            self.counts[idx] = 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.count += 1
+
+    # "pct" is in the range 0..100; uses the nearest-rank method
+    def percentile(self, pct):
+        count = self.count
+        if not count:
+            return None
+
+        (cache_count, cache) = self._cache
+        if cache_count == count and pct in cache:
+            return cache[pct]
+
+        (buckets_cnt, sorted_idx) = self._sorted_idx
+        if buckets_cnt != len(self.counts):
+            sorted_idx = sorted(list(self.counts)) # list() of a dict is atomic
+            self._sorted_idx = (len(sorted_idx), sorted_idx)
+
+        rank = max(1, math.ceil(pct / 100 * count))
+        seen = 0
+        for idx in sorted_idx:
+            seen += self.counts[idx]
+            if seen >= rank:
+                break
+
+        # "min" and "max" are set before "count" grows, so they are not None
+        value = min(max(self._bucket_value(idx), self.min), self.max)
+        if cache_count != count:
+            cache = {}
+            self._cache = (count, cache)
+        cache[pct] = value
+        return value
+
+# Interarrival jitter as defined in RFC 3550, section 6.4.1, applied to the
+# RTT of consecutive replies: a running average of the absolute difference
+# between two consecutive samples, with a gain of 1/16.
+class JitterEstimator:
+    __slots__ = ('jitter', 'last')
+
+    def __init__(self):
+        self.jitter = None
+        self.last = None
+
+    def add(self, value):
+        if self.last is not None:
+            if self.jitter is None:
+                self.jitter = 0.0
+            self.jitter += (abs(value - self.last) - self.jitter) / 16
+        self.last = value
+
+# The results of add() of SeqWindow
+SEQ_NEW = 0 # the first result of the newest probe so far
+SEQ_OUT_OF_ORDER = 1 # the first result of an older probe
+SEQ_DUPLICATE = 2 # a reply to a probe which was answered already
+SEQ_LATE = 3 # a reply to a probe which timed out or failed, or is too old to tell
+SEQ_SEEN = 4 # a timeout or an error for a probe which has a result already
+
+SEQ_MODULO = 65536 # "icmp_seq" is 16 bits
+SEQ_WINDOW = 1024 # the number of probes which SeqWindow remembers
+_SEQ_WINDOW_MASK = (1 << SEQ_WINDOW) - 1
+
+# Which of the last SEQ_WINDOW probes of a host got a reply and which timed out
+# or failed, as two bitmaps relative to the newest sequence number: bit N is
+# the probe "newest - N". So the memory is fixed, however long the run is.
+#
+# The "icmp_seq" of "ping" wraps around after 65535. Each sequence number is
+# therefore "unwrapped" to the one nearest to the newest seen, which is also
+# how the probes get counted past the wraparound.
+class SeqWindow:
+    __slots__ = ('newest', 'replied', 'failed')
+
+    def __init__(self):
+        self.newest = None
+        self.replied = 0
+        self.failed = 0
+
+    # Records a reply or another result (a timeout, an error) of a probe.
+    # Returns the unwrapped sequence number and one of the SEQ_* codes.
+    def add(self, seq, is_reply):
+        newest = self.newest
+        if newest is not None:
+            delta = (seq - newest) % SEQ_MODULO
+            if delta >= SEQ_MODULO // 2:
+                delta -= SEQ_MODULO
+            seq = newest + delta
+
+        if newest is None or seq > newest:
+            if newest is not None:
+                self.replied = (self.replied << delta) & _SEQ_WINDOW_MASK
+                self.failed = (self.failed << delta) & _SEQ_WINDOW_MASK
+            self.newest = seq
+            (bit, status) = (1, SEQ_NEW)
+        else:
+            pos = newest - seq
+            if pos >= SEQ_WINDOW:
+                return (seq, SEQ_LATE if is_reply else SEQ_SEEN)
+
+            bit = 1 << pos
+            if self.replied & bit:
+                return (seq, SEQ_DUPLICATE if is_reply else SEQ_SEEN)
+            if self.failed & bit:
+                return (seq, SEQ_LATE if is_reply else SEQ_SEEN)
+            status = SEQ_OUT_OF_ORDER
+
+        if is_reply:
+            self.replied |= bit
+        else:
+            self.failed |= bit
+        return (seq, status)
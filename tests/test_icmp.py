@@ -0,0 +1,51 @@
+import socket
+import struct
+import unittest
+import ping_multi_ext.icmp as icmp
+import ping_multi_ext.parser as parser
+
+# a stand-in for the ping socket, which returns the queued replies once
+class FakeSocket:
+    def __init__(self, replies):
+        self.replies = replies
+
+    def recvmsg(self, bufsize, ancbufsize):
+        if not len(self.replies):
+            raise BlockingIOError()
+        return self.replies.pop(0)
+
+def echo_reply(seq, sent_at, ancdata):
+    data = icmp._icmp_hdr_fmt.pack(icmp.ICMP_ECHO_REPLY, 0, 0, 0, seq) + \
+        icmp._payload_fmt.pack(sent_at) + icmp._payload_padding
+    return (data, ancdata, 0, None)
+
+# a pinger which got "replies", without a real socket
+def new_pinger(replies, now):
+    pinger = icmp.NativePinger.__new__(icmp.NativePinger)
+    pinger.clock = lambda: now
+    pinger.address = '192.0.2.1'
+    pinger.echo_reply_type = icmp.ICMP_ECHO_REPLY
+    pinger.sock = FakeSocket(replies)
+    pinger.seq = 2
+    pinger.answered = False
+    return pinger
+
+class NativePingerTest(unittest.TestCase):
+    def test_reply_without_ttl(self):
+        ttl_cmsg = (socket.IPPROTO_IP, socket.IP_TTL, struct.pack('i', 57))
+        pinger = new_pinger([echo_reply(1, 10.0, [ttl_cmsg]), echo_reply(2, 10.5, [])], 10.525)
+
+        lines = pinger.receive().splitlines()
+        self.assertEqual(lines, [
+            '64 bytes from 192.0.2.1: icmp_seq=1 ttl=57 time=525 ms',
+            '64 bytes from 192.0.2.1: icmp_seq=2 time=25.0 ms',
+        ])
+        self.assertTrue(pinger.answered)
+
+        # both are replies, with their RTT
+        line_parser = parser.LINE_PARSERS['ping']()
+        self.assertEqual(line_parser.parse(lines[0].encode('ascii')), (parser.LINE_REPLY, 1, 57, 525))
+        self.assertEqual(line_parser.parse(lines[1].encode('ascii')), (parser.LINE_REPLY, 2, None, 25))
+
+if __name__ == '__main__':
+    unittest.main()
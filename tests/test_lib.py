@@ -0,0 +1,76 @@
+import ipaddress
+import unittest
+import ping_multi_ext.lib
+
+def expand(host_input, excluded=None, count_limit=1000):
+    return list(ping_multi_ext.lib.iter_network_hosts(host_input, False, count_limit, excluded))
+
+def ip_int(text):
+    return int(ipaddress.ip_address(text))
+
+class NetworkHostsTest(unittest.TestCase):
+    def test_ipv4_network(self):
+        self.assertEqual(expand('10.0.0.0/30'), ['10.0.0.1', '10.0.0.2'])
+        self.assertEqual(expand('10.0.0.5/30'), ['10.0.0.5', '10.0.0.6']) # not strict
+        self.assertEqual(expand('10.0.0.0/31'), ['10.0.0.0', '10.0.0.1'])
+        self.assertEqual(expand('10.0.0.7/32'), ['10.0.0.7'])
+
+    def test_ipv6_network(self):
+        self.assertEqual(expand('2001:db8::/126'), ['2001:db8::1', '2001:db8::2', '2001:db8::3'])
+        self.assertEqual(expand('2001:db8::/127'), ['2001:db8::', '2001:db8::1'])
+
+    def test_range_of_the_last_octet(self):
+        self.assertEqual(len(expand('10.0.0.1-200')), 200)
+        self.assertEqual(expand('10.0.0.1-200')[-1], '10.0.0.200')
+        self.assertEqual(expand('10.0.0.9-9'), ['10.0.0.9'])
+        self.assertEqual(expand('2001:db8::fe-101'), ['2001:db8::fe', '2001:db8::ff', '2001:db8::100', '2001:db8::101'])
+
+    def test_range_of_full_addresses(self):
+        self.assertEqual(expand('10.0.0.254-10.0.1.1'), ['10.0.0.254', '10.0.0.255', '10.0.1.0', '10.0.1.1'])
+        self.assertEqual(expand('2001:db8::ffff-2001:db8::1:0'), ['2001:db8::ffff', '2001:db8::1:0'])
+
+    def test_not_a_network(self):
+        for host in ('example.com', 'host-1', '10.0.0.1', '2001:db8::1'):
+            self.assertEqual(expand(host), [host])
+
+    def test_invalid_ranges(self):
+        for host in ('10.0.0.5-300', '10.0.0.5-1', '10.0.0.1-2001:db8::1', '10.0.0.300/24'):
+            with self.assertRaises(ping_multi_ext.lib.CidrDebugError):
+                ping_multi_ext.lib.parse_address_range(host, True)
+            # without "debug", it's taken as a hostname
+            self.assertIsNone(ping_multi_ext.lib.parse_address_range(host, False))
+
+    def test_network_too_big(self):
+        with self.assertRaises(ping_multi_ext.lib.NetworkTooBigError) as cm:
+            expand('10.0.0.0/16', count_limit=1000)
+        self.assertEqual(cm.exception.num_addresses, 65534)
+
+class HostSetTest(unittest.TestCase):
+    def test_merged_ranges(self):
+        excluded = ping_multi_ext.lib.HostSet(
+            ['10.0.0.4-6', '10.0.0.0/30', '10.0.0.2', '10.0.0.9', '10.0.0.10-11', 'gw', '2001:db8::/127'], False
+        )
+
+        # the network and broadcast address count too; adjacent ranges are merged
+        self.assertEqual(excluded.ranges[4][0], [
+            (ip_int('10.0.0.0'), ip_int('10.0.0.6')),
+            (ip_int('10.0.0.9'), ip_int('10.0.0.11')),
+        ])
+        self.assertEqual(excluded.ranges[6][0], [(ip_int('2001:db8::'), ip_int('2001:db8::1'))])
+        self.assertEqual(excluded.names, {'gw'})
+
+        self.assertTrue(excluded.contains('gw'))
+        self.assertTrue(excluded.contains('10.0.0.6'))
+        self.assertFalse(excluded.contains('10.0.0.7'))
+        self.assertTrue(excluded.contains('2001:db8::1'))
+        self.assertFalse(excluded.contains('2001:db8::2'))
+        self.assertFalse(excluded.contains('example.com'))
+
+    def test_excluded_hosts(self):
+        excluded = ping_multi_ext.lib.HostSet(['10.0.0.1-6', '10.0.0.9-13', 'gw'], False)
+        self.assertEqual(expand('10.0.0.0/28', excluded), ['10.0.0.7', '10.0.0.8', '10.0.0.14'])
+        self.assertEqual(expand('gw', excluded), [])
+        self.assertEqual(expand('10.0.0.3', excluded), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import ping_multi_ext.parser as parser
+
+class PingLineParserTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = parser.LINE_PARSERS['ping']()
+
+    def parse(self, line):
+        return self.parser.parse(line.encode('ascii'))
+
+    def test_reply(self):
+        self.assertEqual(self.parse('64 bytes from 192.0.2.1: icmp_seq=5 ttl=64 time=1.5 ms'), (parser.LINE_REPLY, 5, 64, 2))
+        # BusyBox counts from 0
+        self.assertEqual(self.parse('64 bytes from 192.0.2.1: seq=0 ttl=64 time=0.058 ms'), (parser.LINE_REPLY, 1, 64, 0))
+        self.assertEqual(
+            self.parse('64 bytes from 192.0.2.1: icmp_seq=5 ttl=64 time=1.5 ms (DUP!)'), (parser.LINE_DUPLICATE, 5, 64, 2)
+        )
+
+    def test_reply_without_ttl(self):
+        self.assertEqual(self.parse('64 bytes from 192.0.2.1: icmp_seq=5 time=1.5 ms'), (parser.LINE_REPLY, 5, None, 2))
+        self.assertEqual(
+            self.parse('64 bytes from 192.0.2.1: icmp_seq=5 time=1.5 ms (DUP!)'), (parser.LINE_DUPLICATE, 5, None, 2)
+        )
+
+    def test_loose_reply(self):
+        self.assertEqual(self.parse('64 bytes from 192.0.2.1: icmp_req=5 ttl=64 time=7 ms'), (parser.LINE_REPLY, None, 64, 7))
+        self.assertEqual(self.parse('64 bytes from 192.0.2.1: icmp_req=5 time=7 ms'), (parser.LINE_REPLY, None, None, 7))
+
+    def test_other_lines(self):
+        self.assertEqual(self.parse('no answer yet for icmp_seq=3'), (parser.LINE_TIMEOUT, 3, None, None))
+        self.assertEqual(self.parse('PING h (192.0.2.1) 56(84) bytes of data.'), (parser.LINE_HEADER, None, None, None))
+        self.assertEqual(
+            self.parse('From 192.0.2.254 icmp_seq=4 Destination Host Unreachable'), (parser.LINE_ERROR, 4, None, None)
+        )
+        self.assertEqual(self.parse(''), (parser.LINE_EMPTY, None, None, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import time
+import unittest
+import ping_multi_ext.proc
+import ping_multi_ext.host
+import ping_multi_ext.history
+
+def reply(seq, time_ms, dup=False):
+    line = f'64 bytes from h: icmp_seq={seq} ttl=64 time={time_ms} ms'
+    return (line + ' (DUP!)' if dup else line).encode('ascii')
+
+def new_hosts_data(hostnames):
+    hosts_data = {}
+    for hostname in hostnames:
+        raw = ping_multi_ext.history.RingBuffer()
+        raw.append('')
+        hosts_data[hostname] = ping_multi_ext.host.HostState(
+            'ping ' + hostname, ping_multi_ext.history.RingBuffer(typecode='i'), raw
+        )
+    return hosts_data
+
+def new_workflow():
+    hosts_data = new_hosts_data(['h'])
+    return (ping_multi_ext.proc.Workflow(hosts_data, 1), hosts_data['h'])
+
+class SplitLinesTest(unittest.TestCase):
+    def test_line_split_across_reads(self):
+        partial = bytearray()
+        self.assertEqual(ping_multi_ext.proc.split_lines(b'64 bytes', 8, partial), [])
+        self.assertEqual(ping_multi_ext.proc.split_lines(b' from h\n', 8, partial), [b'64 bytes from h'])
+        self.assertEqual(partial, b'')
+
+    def test_chunk_without_a_newline(self):
+        partial = bytearray(b'abc')
+        self.assertEqual(ping_multi_ext.proc.split_lines(b'def', 3, partial), [])
+        self.assertEqual(partial, b'abcdef')
+
+    def test_several_lines_and_a_remainder(self):
+        partial = bytearray()
+        lines = ping_multi_ext.proc.split_lines(b'one\n\ntwo\nthr', 12, partial)
+        self.assertEqual(lines, [b'one', b'', b'two'])
+        self.assertEqual(partial, b'thr')
+
+    def test_only_the_first_n_bytes(self):
+        # the read buffer is reused, so anything after "n" is from an older read
+        buf = bytearray(b'new\nstale\nstale\n')
+        partial = bytearray()
+        self.assertEqual(ping_multi_ext.proc.split_lines(buf, 6, partial), [b'new'])
+        self.assertEqual(partial, b'st')
+
+class HandleStreamTest(unittest.TestCase):
+    def test_incomplete_last_line_at_eof(self):
+        hosts_data = new_hosts_data(['h0', 'h1'])
+        # the last line has no "\n", like the last error of "ssh"
+        ssh_mux = [{'cmdline': "sh -c 'printf \"0:a\\\\n1:b\\\\nConnection closed\"'", 'hosts': ['h0', 'h1']}]
+        workflow = ping_multi_ext.proc.Workflow(hosts_data, 1, ssh_mux=ssh_mux)
+
+        workflow.start_all_processes()
+        deadline = time.monotonic() + 10
+        while any(data.pid is not None for data in hosts_data.values()) and time.monotonic() < deadline:
+            workflow.update_hosts_data(0.1)
+
+        for (hostname, line) in (('h0', 'a'), ('h1', 'b')):
+            self.assertEqual(list(hosts_data[hostname].raw), [
+                line, 'Connection closed', 'Command terminated.', '== Process exited with status 0'
+            ])
+
+class HandleLineTest(unittest.TestCase):
+    def test_counters(self):
+        (workflow, data) = new_workflow()
+        workflow.handle_lines('h', [
+            reply(1, 5),
+            reply(3, 7),
+            reply(2, 6), # out of order
+            reply(2, 6, dup=True),
+            b'no answer yet for icmp_seq=4',
+            reply(4, 1500), # late
+        ])
+
+        self.assertEqual(
+            (data.tx_cnt, data.rx_cnt, data.dup_cnt, data.ooo_cnt, data.late_cnt),
+            (4, 3, 1, 1, 1)
+        )
+        self.assertEqual(list(data.parsed), [5, 7, 6, ping_multi_ext.host.PD_TIMEOUT])
+        self.assertEqual(data.rtt_stats.count, 4) # with the late reply
+        self.assertEqual(data.last, 1500)
+
+    def test_tx_cnt_after_the_wraparound(self):
+        (workflow, data) = new_workflow()
+        workflow.handle_lines('h', [reply(65535, 5), reply(0, 5), reply(1, 5)])
+
+        self.assertEqual((data.tx_cnt, data.rx_cnt), (65537, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import io
+import struct
+import tempfile
+import unittest
+import ping_multi_ext.recording as recording
+import ping_multi_ext.parser as parser
+
+HOSTS = ['a', 'b']
+
+# a line of 3 records: 18 + 18 + 8 bytes
+LONG_LINE = '64 bytes from a: icmp_seq=1 time=0.5 ms long'
+
+# (hostname, kind, seq, rtt, is_timeout) as given to Recorder.add_sample()
+SAMPLES = [
+    ('a', parser.LINE_REPLY, 1, 12, False),
+    ('b', parser.LINE_TIMEOUT, 2, None, True),
+    ('a', parser.LINE_DUPLICATE, 1, 13, False),
+    ('b', parser.LINE_REPLY, 3, 'ERR', False),
+    ('a', parser.LINE_ERROR, None, None, False),
+]
+
+class RecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'rec.bin')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def record(self):
+        recorder = recording.Recorder(self.path, HOSTS, 1, True)
+        expected = []
+        ts = 1000.0
+        for (hostname, kind, seq, rtt, is_timeout) in SAMPLES:
+            recorder.add_sample(hostname, kind, seq, rtt, is_timeout, ts)
+            expected.append((ts, hostname, kind, seq, rtt, is_timeout))
+            ts += 0.5
+        for (hostname, line) in (('b', ''), ('a', 'PING a'), ('b', LONG_LINE)):
+            recorder.add_raw_line(hostname, line, ts)
+            expected.append((ts, hostname, None, line, None, None))
+            ts += 0.5
+        recorder.close()
+        return expected
+
+    def read(self, chunk_records=4096):
+        with open(self.path, 'rb') as f:
+            header = recording.read_header(f)
+            return (header, list(recording.iter_records(f, header['hosts'], chunk_records)))
+
+    def test_round_trip(self):
+        expected = self.record()
+
+        # the raw lines also span the chunks
+        for chunk_records in (1, 2, 4096):
+            (header, records) = self.read(chunk_records)
+            self.assertEqual(header['hosts'], HOSTS)
+            self.assertTrue(header['raw'])
+            self.assertEqual(records, expected)
+
+    def test_truncated_last_record(self):
+        expected = self.record()
+
+        # the last record, with the last 8 bytes of LONG_LINE, is incomplete
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 5)
+        (_, records) = self.read()
+        self.assertEqual(records[:-1], expected[:-1])
+        self.assertEqual(records[-1][3], LONG_LINE[:36])
+
+    def test_not_a_recording(self):
+        with self.assertRaisesRegex(recording.RecordingFormatError, 'not a ping-multi recording'):
+            recording.read_header(io.BytesIO(b'{"hosts": []}'))
+
+    def test_corrupted_header(self):
+        for data in (recording.MAGIC + b'\x01', recording.MAGIC + struct.pack('<I', 5) + b'{"ho'):
+            with self.assertRaisesRegex(recording.RecordingFormatError, 'corrupted header'):
+                recording.read_header(io.BytesIO(data))
+
+    def test_invalid_host_index(self):
+        recorder = recording.Recorder(self.path, ['a', 'b', 'c'], 1, False)
+        recorder.add_sample('c', parser.LINE_REPLY, 1, 12, False, 1000.0)
+        recorder.close()
+
+        with open(self.path, 'rb') as f:
+            recording.read_header(f)
+            with self.assertRaisesRegex(recording.RecordingFormatError, 'invalid host index 2'):
+                list(recording.iter_records(f, HOSTS))
+
+class FormatProbeLineTest(unittest.TestCase):
+    # each sample is replayed as a line which parses back to the same result
+    def test_parse_back(self):
+        line_parser = parser.LINE_PARSERS['ping']()
+        for (hostname, kind, seq, rtt, _) in SAMPLES:
+            line = recording.format_probe_line(hostname, kind, seq, rtt)
+            (parsed_kind, parsed_seq, _, parsed_rtt) = line_parser.parse(line.encode('ascii'))
+
+            if rtt == 'ERR': # a reply without a valid RTT is an error
+                self.assertEqual((parsed_kind, parsed_seq, parsed_rtt), (parser.LINE_ERROR, seq, None))
+            else:
+                self.assertEqual((parsed_kind, parsed_seq, parsed_rtt), (kind, seq, rtt))
+
+if __name__ == '__main__':
+    unittest.main()
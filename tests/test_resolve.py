@@ -0,0 +1,47 @@
+import socket
+import threading
+import unittest
+import ping_multi_ext.resolve
+
+# a stand-in for lookup_address(), which counts the lookups of each name
+class FakeLookup:
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, name):
+        with self.lock:
+            self.calls.append(name)
+        if name not in self.addresses:
+            raise socket.gaierror(f'{name}: Name or service not known')
+        return self.addresses[name]
+
+class ResolveAllTest(unittest.TestCase):
+    def test_each_name_once(self):
+        lookup = FakeLookup({'a.example': '192.0.2.1', 'b.example': '2001:db8::2'})
+        results = ping_multi_ext.resolve.resolve_all(
+            ['b.example', 'a.example', 'b.example', 'a.example'], lookup, max_workers=4
+        )
+
+        self.assertEqual(list(results), ['b.example', 'a.example']) # in the original order
+        self.assertEqual(results['a.example'], ('192.0.2.1', None))
+        self.assertEqual(results['b.example'], ('2001:db8::2', None))
+        self.assertEqual(sorted(lookup.calls), ['a.example', 'b.example'])
+
+    def test_ip_addresses_are_not_looked_up(self):
+        lookup = FakeLookup({})
+        results = ping_multi_ext.resolve.resolve_all(['192.0.2.7', '2001:db8::7', '192.0.2.7'], lookup)
+
+        self.assertEqual(results, {'192.0.2.7': ('192.0.2.7', None), '2001:db8::7': ('2001:db8::7', None)})
+        self.assertEqual(lookup.calls, [])
+
+    def test_lookup_error(self):
+        lookup = FakeLookup({'a.example': '192.0.2.1'})
+        results = ping_multi_ext.resolve.resolve_all(['a.example', 'missing.example'], lookup)
+
+        self.assertEqual(results['a.example'], ('192.0.2.1', None))
+        self.assertEqual(results['missing.example'], (None, 'missing.example: Name or service not known'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import stat
+import tempfile
+import subprocess
+import unittest
+import ping_multi_ext.lib
+import ping_multi_ext.proc
+
+# a local stand-in for "ssh": a warning without a host ID, then the remote command
+FAKE_SSH = '''#!/bin/sh
+for last; do :; done
+echo "Warning: Permanently added 'loc' to the list of known hosts." >&2
+exec sh -c "$last"
+'''
+
+# a stand-in for "ping", which fails for the target "fail"
+FAKE_PING = '''#!/bin/sh
+for last; do :; done
+echo "PING $last"
+if [ "$last" = fail ]; then
+    exit 2
+fi
+echo "64 bytes from $last: icmp_seq=1 ttl=64 time=0.5 ms"
+'''
+
+class SshMuxStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for (name, script) in (('ssh', FAKE_SSH), ('ping', FAKE_PING)):
+            path = os.path.join(self.tmp_dir.name, name)
+            with open(path, 'w') as f:
+                f.write(script)
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_mux(self, hosts):
+        cmdline = ping_multi_ext.lib.compose_ssh_mux_cmd('loc', hosts, {'wait': 1, 'interval': 1})
+        env = dict(os.environ, PATH=self.tmp_dir.name + os.pathsep + os.environ['PATH'])
+        res = subprocess.run(cmdline, shell=True, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        stream = ping_multi_ext.proc.SshMuxStream(cmdline, hosts)
+        events = stream.feed(res.stdout.split(b'\n')[:-1])
+        return (stream, events)
+
+    def test_demultiplex_by_host_id(self):
+        (stream, events) = self.run_mux(['ok@loc', 'fail@loc'])
+
+        # the hosts run in parallel, so only the order of each host is known
+        by_host = {}
+        for (hostname, line, exit_status) in events:
+            by_host.setdefault(hostname, []).append((line, exit_status))
+
+        warning = (b"Warning: Permanently added 'loc' to the list of known hosts.", None)
+        self.assertEqual(by_host['ok@loc'], [
+            warning,
+            (b'PING ok', None),
+            (b'64 bytes from ok: icmp_seq=1 ttl=64 time=0.5 ms', None),
+            (None, '0'),
+        ])
+        self.assertEqual(by_host['fail@loc'], [
+            warning,
+            (b'PING fail', None),
+            (None, '2'),
+        ])
+        self.assertEqual(stream.running, set())
+
+    def test_lines_without_an_id_go_to_the_running_hosts(self):
+        stream = ping_multi_ext.proc.SshMuxStream('ssh', ['a', 'b', 'c'])
+        self.assertEqual(stream.feed([b'1:\x01255', b'Connection to loc closed.', b'9:out of range']), [
+            ('b', None, '255'),
+            ('a', b'Connection to loc closed.', None),
+            ('c', b'Connection to loc closed.', None),
+            ('a', b'9:out of range', None),
+            ('c', b'9:out of range', None),
+        ])
+        self.assertEqual(stream.running, {'a', 'c'})
+
+if __name__ == '__main__':
+    unittest.main()
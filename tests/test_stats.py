@@ -0,0 +1,72 @@
+import unittest
+import ping_multi_ext.stats
+
+class LogHistogramTest(unittest.TestCase):
+    def test_single_sample(self):
+        hist = ping_multi_ext.stats.LogHistogram()
+        hist.add(1500)
+        for pct in (1, 50, 90, 99, 100):
+            self.assertEqual(hist.percentile(pct), 1500)
+
+    def test_samples_at_the_top_of_a_bucket(self):
+        hist = ping_multi_ext.stats.LogHistogram()
+        # 1500 is in the bucket 1472..1535, whose midpoint is 1503
+        for value in (10, 20, 1490, 1500):
+            hist.add(value)
+        self.assertEqual(hist.percentile(99), 1500)
+        self.assertEqual(hist.percentile(1), 10)
+
+        hist.add(1535) # the top of the same bucket
+        self.assertEqual(hist.percentile(99), 1503)
+
+    def test_percentiles_within_min_and_max(self):
+        hist = ping_multi_ext.stats.LogHistogram()
+        added = []
+        for value in (33, 47, 95, 130, 777, 4096, 4097, 65535):
+            hist.add(value)
+            added.append(value)
+            for pct in (0, 50, 90, 99, 100):
+                self.assertTrue(min(added) <= hist.percentile(pct) <= max(added))
+
+class SeqWindowTest(unittest.TestCase):
+    def test_wraparound(self):
+        window = ping_multi_ext.stats.SeqWindow()
+        for (seq, unwrapped) in ((65534, 65534), (65535, 65535), (0, 65536), (1, 65537)):
+            self.assertEqual(window.add(seq, True), (unwrapped, ping_multi_ext.stats.SEQ_NEW))
+
+    def test_reordered_reply_across_the_wraparound(self):
+        window = ping_multi_ext.stats.SeqWindow()
+        window.add(65534, True)
+        window.add(0, True)
+        self.assertEqual(window.add(65535, True), (65535, ping_multi_ext.stats.SEQ_OUT_OF_ORDER))
+
+    def test_duplicate(self):
+        window = ping_multi_ext.stats.SeqWindow()
+        self.assertEqual(window.add(5, True), (5, ping_multi_ext.stats.SEQ_NEW))
+        self.assertEqual(window.add(5, True), (5, ping_multi_ext.stats.SEQ_DUPLICATE))
+        self.assertEqual(window.add(5, False), (5, ping_multi_ext.stats.SEQ_SEEN))
+
+    def test_reordered_reply(self):
+        window = ping_multi_ext.stats.SeqWindow()
+        window.add(1, True)
+        window.add(3, True)
+        self.assertEqual(window.add(2, True), (2, ping_multi_ext.stats.SEQ_OUT_OF_ORDER))
+        self.assertEqual(window.add(2, True), (2, ping_multi_ext.stats.SEQ_DUPLICATE))
+
+    def test_reply_after_a_timeout(self):
+        window = ping_multi_ext.stats.SeqWindow()
+        window.add(1, True)
+        self.assertEqual(window.add(2, False), (2, ping_multi_ext.stats.SEQ_NEW)) # "no answer yet"
+        self.assertEqual(window.add(2, True), (2, ping_multi_ext.stats.SEQ_LATE))
+        self.assertEqual(window.add(2, False), (2, ping_multi_ext.stats.SEQ_SEEN))
+
+    def test_reply_older_than_the_window(self):
+        window = ping_multi_ext.stats.SeqWindow()
+        window.add(2000, True)
+        oldest = 2000 - ping_multi_ext.stats.SEQ_WINDOW + 1
+        self.assertEqual(window.add(oldest, True), (oldest, ping_multi_ext.stats.SEQ_OUT_OF_ORDER))
+        self.assertEqual(window.add(oldest - 1, True), (oldest - 1, ping_multi_ext.stats.SEQ_LATE))
+        self.assertEqual(window.add(oldest - 1, False), (oldest - 1, ping_multi_ext.stats.SEQ_SEEN))
+
+if __name__ == '__main__':
+    unittest.main()